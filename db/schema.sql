@@ -6,3 +6,17 @@ CREATE TABLE activitypub_actor_links (
 
   PRIMARY KEY(user_id)
 );
+
+CREATE TABLE currency_ledger (
+  id BIGSERIAL,
+  created_at TIMESTAMP NOT NULL,
+  kind TEXT NOT NULL,
+  sender_id BIGINT,
+  recipient_id BIGINT,
+  amount DOUBLE PRECISION NOT NULL,
+
+  PRIMARY KEY(id)
+);
+
+CREATE INDEX currency_ledger_sender_id_idx ON currency_ledger (sender_id);
+CREATE INDEX currency_ledger_recipient_id_idx ON currency_ledger (recipient_id);
@@ -0,0 +1,96 @@
+__all__ = ['AhoCorasick']
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+
+class AhoCorasick:
+    """An Aho–Corasick automaton over a list of strings.
+
+    Finds which of the strings occur in a text in a single pass over the
+    text, no matter how many strings there are. Strings are identified by
+    their index in the list that the automaton was built from.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        #: state -> {character: state}
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+
+        #: state -> the lowest index of the patterns that end at it (or at
+        #: any of its suffixes), or None
+        self.first: List[Optional[int]] = [None]
+
+        self.patterns = list(patterns)
+
+        for index, pattern in enumerate(self.patterns):
+            self._add(index, pattern)
+
+        self._link()
+
+    def _add(self, index: int, pattern: str):
+        if not pattern:
+            # the empty string is in everything
+            self.first[0] = index if self.first[0] is None else min(self.first[0], index)
+            return
+
+        state = 0
+        for character in pattern:
+            next_state = self.goto[state].get(character)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][character] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.first.append(None)
+            state = next_state
+
+        if self.first[state] is None or index < self.first[state]:
+            self.first[state] = index
+
+    def _link(self):
+        # breadth-first, so that the failure state of every state is linked
+        # before the state itself
+        queue = deque(self.goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for character, child in self.goto[state].items():
+                queue.append(child)
+
+                fallback = self.fail[state]
+                while fallback and character not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+
+                target = self.goto[fallback].get(character, 0)
+                self.fail[child] = target if target != child else 0
+
+                inherited = self.first[self.fail[child]]
+                if inherited is not None and (self.first[child] is None or inherited < self.first[child]):
+                    self.first[child] = inherited
+
+    def first_match(self, text: str) -> Optional[int]:
+        """Return the lowest index of the patterns that occur in a text, or None."""
+        goto, fail, first = self.goto, self.fail, self.first
+        best = first[0]
+
+        if best == 0:
+            return best
+
+        state = 0
+        for character in text:
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+
+            found = first[state]
+            if found is not None and (best is None or found < best):
+                if found == 0:
+                    return found
+                best = found
+
+        return best
+
+    def __len__(self) -> int:
+        return len(self.patterns)
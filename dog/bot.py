@@ -1,15 +1,18 @@
 import logging
+from typing import Callable, Dict, List, Tuple
 
 import aiohttp
-import asyncio
 import discord
 from lifesaver.bot import Bot
-from lifesaver.bot.storage import AsyncJSONStorage
 from quart.logging import create_serving_logger
 from quart.serving import Server
 
 from dog.context import Context
+from dog.editor_index import EditorIndex
 from dog.guild_config import GuildConfigManager
+from dog.pipeline import MessagePipeline
+from dog.scheduler import EventScheduler
+from dog.storage import AsyncLogStorage
 from dog.web.server import app as webapp
 from dog.helpformatter import HelpFormatter
 
@@ -18,54 +21,130 @@ log = logging.getLogger(__name__)
 
 class Dogbot(Bot):
     def __init__(self, *args, **kwargs):
+        #: event name -> [(cog bit, cog name, listener)], built lazily from extra_events
+        self.dispatch_table: Dict[str, List[Tuple[int, str, Callable]]] = {}
+
+        #: cog name -> bit used in disabled cog masks
+        self.cog_bits: Dict[str, int] = {}
+
+        #: guild id -> mask of the cogs that are disabled in that guild
+        self.disabled_cog_masks: Dict[int, int] = {}
+
+        self.message_pipeline = MessagePipeline(self)
+
         super().__init__(*args, context_cls=Context, formatter=HelpFormatter(), **kwargs)
         self.session = aiohttp.ClientSession(loop=self.loop)
-        self.load_all()
-        self.blacklisted_storage = AsyncJSONStorage('blacklisted_users.json', loop=self.loop)
+
+        scheduler_config = getattr(self.config, 'scheduler', None) or {}
+        self.scheduler = EventScheduler(self, **scheduler_config)
+        self.blacklisted_storage = AsyncLogStorage('blacklisted_users.json', loop=self.loop)
         self.guild_configs = GuildConfigManager(self)
+        self.editor_index = EditorIndex(self)
+        self.load_all()
 
         webapp.bot = self
         webapp.secret_key = self.config.web['secret_key']
         self.boot_server()
 
+    def add_cog(self, cog):
+        super().add_cog(cog)
+        self.message_pipeline.add_cog(cog)
+        self.guild_configs.add_cog(cog)
+
+        # masks only include loaded cogs, so they could be missing this one
+        self.disabled_cog_masks.clear()
+
+    def remove_cog(self, name):
+        cog = self.cogs.get(name)
+        if cog is not None:
+            self.message_pipeline.remove_cog(cog)
+            self.guild_configs.remove_cog(cog)
+        super().remove_cog(name)
+
+    def add_listener(self, func, name=None):
+        super().add_listener(func, name)
+        self.dispatch_table.clear()
+
+    def remove_listener(self, func, name=None):
+        super().remove_listener(func, name)
+        self.dispatch_table.clear()
+
+    def cog_bit(self, cog_name: str) -> int:
+        """Return the bit that represents a cog in disabled cog masks."""
+        bit = self.cog_bits.get(cog_name)
+        if bit is None:
+            bit = self.cog_bits[cog_name] = 1 << len(self.cog_bits)
+        return bit
+
+    def _compile_listeners(self, ev: str) -> List[Tuple[int, str, Callable]]:
+        handlers = []
+
+        for event in self.extra_events.get(ev, []):
+            # if the event (method) qualified name has a single . (which means
+            # we are inside of a cog), split the qualified name to grab the cog
+            # name so that we can avoid dispatching if the cog is disabled
+            ev_name = event.__qualname__
+            if ev_name.count('.') == 1:
+                cog_name, _method_name = ev_name.split('.')
+                handlers.append((self.cog_bit(cog_name), cog_name, event))
+            else:
+                handlers.append((0, 'Dogbot', event))
+
+        self.dispatch_table[ev] = handlers
+        return handlers
+
     def dispatch(self, event_name, *args, **kwargs):
         """Modified version of the vanilla dispatch to fit disabled_cogs."""
         discord.Client.dispatch(self, event_name, *args, **kwargs)
 
         ev = 'on_' + event_name
-        guild = None
+        handlers = self.dispatch_table.get(ev)
+        if handlers is None:
+            handlers = self._compile_listeners(ev)
+        if not handlers:
+            return
 
         # yup, this can't go wrong at all
         # extract the guild from A.guild or A if it's already a guild, with A
         # being the first arg
+        guild = None
         first_arg = args[0] if args else None
         if hasattr(first_arg, 'guild') and isinstance(first_arg.guild, discord.Guild):
             guild = first_arg.guild
         elif isinstance(first_arg, discord.Guild):
             guild = first_arg
 
-        for event in self.extra_events.get(ev, []):
-            # if we have a guild and the event (method) qualified name has a .
-            # (which means we are inside of a cog), split the qualified name
-            # to grab the cog name then check the configuration to avoid
-            # dispatching if required
-            ev_name = event.__qualname__
-            if ev_name.count('.') == 1 and guild and '.' in ev_name:
-                cog_name, method_name = ev_name.split('.')
-                if self.cog_is_disabled(guild, cog_name):
-                    # log.debug('Dropping dispatch of %s to %s in %d -- cog disabled.', ev, ev_name, guild.id)
-                    continue
+        disabled = self.disabled_cogs_mask(guild) if guild else 0
+
+        for bit, lane, event in handlers:
+            if bit & disabled:
+                continue
 
-            coro = self._run_event(event, event_name, *args, **kwargs)
-            asyncio.ensure_future(coro, loop=self.loop)
+            self.scheduler.submit(lane, event, event_name, *args, **kwargs)
+
+    def disabled_cogs_mask(self, guild: discord.Guild) -> int:
+        """Return a mask of the cogs that are disabled in a guild.
+
+        Names of cogs that aren't loaded are ignored, so configurations
+        can't grow the bit table. The mask is cached until the guild's
+        configuration is written or a cog is loaded.
+        """
+        mask = self.disabled_cog_masks.get(guild.id)
+        if mask is not None:
+            return mask
+
+        mask = 0
+        config = self.guild_configs.get_compiled(guild)
+        if config is not None:
+            for cog_name in config.disabled_cogs:
+                if cog_name in self.cogs:
+                    mask |= self.cog_bit(cog_name)
+
+        self.disabled_cog_masks[guild.id] = mask
+        return mask
 
     def cog_is_disabled(self, guild: discord.Guild, cog_name: str) -> bool:
-        config = self.guild_configs.get(guild)
-        if config:
-            disabled_cogs = config.get('disabled_cogs', [])
-            return cog_name in disabled_cogs
-        else:
-            return False
+        return bool(self.disabled_cogs_mask(guild) & self.cog_bit(cog_name))
 
     async def can_run(self, ctx, **kwargs):
         cog_name = type(ctx.command.instance).__name__
@@ -76,6 +155,15 @@ class Dogbot(Bot):
 
     async def close(self):
         log.info('bot is exiting')
+
+        # write back wallets that were batched by the write-behind layer
+        currency = self.get_cog('Currency')
+        if currency is not None:
+            await currency.manager.close()
+
+        await self.blacklisted_storage.close()
+        await self.guild_configs.persistent.close()
+        self.scheduler.close()
         await self.session.close()
         await super().close()
 
@@ -92,7 +180,11 @@ class Dogbot(Bot):
     async def on_message(self, message: discord.Message):
         await self.wait_until_ready()
 
-        if self.is_blacklisted(message.author):
+        if message.author.bot or self.is_blacklisted(message.author):
             return
 
+        # stages (and their network I/O) run in the scheduler, so they never
+        # hold up command processing, and are shed when messages flood in
+        self.scheduler.submit('pipeline', self.message_pipeline.run, 'message', message)
+
         await super().on_message(message)
@@ -0,0 +1,179 @@
+__all__ = ['EditorIndex']
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+import discord
+
+from dog.guild_config import GuildConfig
+
+log = logging.getLogger(__name__)
+
+
+class EditorIndex:
+    """An index of the guilds that each user can edit the configuration of.
+
+    This mirrors :meth:`GuildConfigManager.can_edit`, but is kept up to date
+    from events (configuration writes, member and role updates, ownership
+    changes, joins and leaves) so that looking up every guild a user can
+    edit doesn't have to check every guild.
+
+    Editors that are listed by tag (``user#discrim``) are indexed by tag, so
+    they are found even if they aren't a member of the guild, like in
+    ``can_edit``.
+    """
+
+    #: guilds to index before yielding to the event loop
+    CHUNK_SIZE = 50
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+
+        #: whether every guild has been indexed
+        self.ready = False
+
+        #: user id -> ids of the guilds they can edit
+        self.by_user: Dict[int, Set[int]] = defaultdict(set)
+
+        #: user#discrim -> ids of the guilds they can edit
+        self.by_tag: Dict[str, Set[int]] = defaultdict(set)
+
+        #: guild id -> user ids and tags that were indexed for it
+        self.guild_users: Dict[int, Set[int]] = {}
+        self.guild_tags: Dict[int, Set[str]] = {}
+
+        for name in ('on_ready', 'on_guild_config_write', 'on_guild_join', 'on_guild_remove', 'on_guild_update',
+                     'on_guild_role_update', 'on_guild_role_delete', 'on_member_join', 'on_member_remove',
+                     'on_member_update'):
+            bot.add_listener(getattr(self, name), name)
+
+    def editable_guilds(self, user: discord.User) -> Set[int]:
+        """Return the ids of the guilds that a user can edit."""
+        return self.by_user.get(user.id, set()) | self.by_tag.get(str(user), set())
+
+    def _config(self, guild: discord.Guild) -> Optional[GuildConfig]:
+        return self.bot.guild_configs.get_compiled(guild)
+
+    def _can_edit(self, guild: discord.Guild, config: Optional[GuildConfig], member: discord.Member) -> bool:
+        if member.id == guild.owner_id:
+            return True
+
+        # with no configuration, people who can ban are let in
+        if config is None:
+            return member.guild_permissions.ban_members
+
+        return config.is_editor(member, member)
+
+    def _link(self, guild_id: int, user_id: int):
+        self.guild_users.setdefault(guild_id, set()).add(user_id)
+        self.by_user[user_id].add(guild_id)
+
+    def _unlink(self, guild_id: int, user_id: int):
+        self.guild_users.get(guild_id, set()).discard(user_id)
+
+        guilds = self.by_user.get(user_id)
+        if guilds is not None:
+            guilds.discard(guild_id)
+            if not guilds:
+                del self.by_user[user_id]
+
+    def drop_guild(self, guild_id: int):
+        for user_id in self.guild_users.pop(guild_id, set()):
+            guilds = self.by_user.get(user_id)
+            if guilds is not None:
+                guilds.discard(guild_id)
+                if not guilds:
+                    del self.by_user[user_id]
+
+        for tag in self.guild_tags.pop(guild_id, set()):
+            guilds = self.by_tag.get(tag)
+            if guilds is not None:
+                guilds.discard(guild_id)
+                if not guilds:
+                    del self.by_tag[tag]
+
+    def index_guild(self, guild: discord.Guild):
+        """(Re)index the editors of a guild."""
+        self.drop_guild(guild.id)
+
+        config = self._config(guild)
+        self._link(guild.id, guild.owner_id)
+
+        for member in guild.members:
+            if self._can_edit(guild, config, member):
+                self._link(guild.id, member.id)
+
+        if config is None:
+            return
+
+        # users that are listed by id can edit even when they aren't members
+        for editor_id in config.editor_ids:
+            if guild.get_role(editor_id) is None:
+                self._link(guild.id, editor_id)
+
+        self.guild_tags[guild.id] = set(config.editor_tags)
+        for tag in config.editor_tags:
+            self.by_tag[tag].add(guild.id)
+
+    def index_member(self, member: discord.Member):
+        """Reindex a single member of a guild."""
+        guild = member.guild
+        config = self._config(guild)
+
+        if self._can_edit(guild, config, member):
+            self._link(guild.id, member.id)
+        elif config is None or member.id not in config.editor_ids:
+            self._unlink(guild.id, member.id)
+
+    async def build(self):
+        self.ready = False
+
+        for index, guild in enumerate(list(self.bot.guilds)):
+            self.index_guild(guild)
+            if index % self.CHUNK_SIZE == 0:
+                await asyncio.sleep(0)
+
+        self.ready = True
+        log.info('indexed editors of %d guild(s)', len(self.guild_users))
+
+    async def on_ready(self):
+        await self.build()
+
+    async def on_guild_config_write(self, guild_id: int):
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None:
+            self.index_guild(guild)
+
+    async def on_guild_join(self, guild: discord.Guild):
+        self.index_guild(guild)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.drop_guild(guild.id)
+
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        if before.owner_id != after.owner_id:
+            self.index_guild(after)
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        # role permissions only matter when the guild has no configuration
+        if before.permissions.ban_members != after.permissions.ban_members and self._config(after.guild) is None:
+            self.index_guild(after.guild)
+
+    async def on_guild_role_delete(self, role: discord.Role):
+        config = self._config(role.guild)
+        if config is None or role.id in config.editor_ids:
+            self.index_guild(role.guild)
+
+    async def on_member_join(self, member: discord.Member):
+        self.index_member(member)
+
+    async def on_member_remove(self, member: discord.Member):
+        config = self._config(member.guild)
+        if member.id != member.guild.owner_id and (config is None or member.id not in config.editor_ids):
+            self._unlink(member.guild.id, member.id)
+
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles or str(before) != str(after):
+            self.index_member(after)
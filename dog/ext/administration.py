@@ -1,6 +1,7 @@
 import discord
 from discord.ext.commands import is_owner
 from lifesaver.bot import Cog, Context, command, group
+from lifesaver.utils.formatting import Table, codeblock
 
 
 class Administration(Cog):
@@ -42,6 +43,43 @@ class Administration(Cog):
             pass
         await ctx.ok()
 
+    @command(hidden=True)
+    @is_owner()
+    async def scheduler(self, ctx: Context):
+        """Views event scheduler statistics."""
+        lanes = sorted(self.bot.scheduler.lanes.values(), key=lambda lane: lane.name)
+        if not lanes:
+            await ctx.send('No events have been scheduled yet.')
+            return
+
+        table = Table('Lane', 'Depth', 'Max', 'Waiting', 'Processed', 'Dropped', 'Avg wait', 'Max wait')
+        for lane in lanes:
+            table.add_row(
+                lane.name, str(lane.depth), str(lane.max_depth), str(lane.waiting), f'{lane.processed:,}',
+                f'{lane.dropped:,}',
+                f'{lane.average_wait * 1000:.2f}ms', f'{lane.max_wait * 1000:.2f}ms',
+            )
+        table = await table.render(loop=self.bot.loop)
+        await ctx.send(codeblock(table))
+
+    @command(hidden=True)
+    @is_owner()
+    async def pipeline(self, ctx: Context):
+        """Views message pipeline statistics."""
+        stages = self.bot.message_pipeline.stages
+        if not stages:
+            await ctx.send('There are no message stages.')
+            return
+
+        table = Table('Stage', 'Order', 'Calls', 'Avg', 'Max')
+        for stage in stages:
+            table.add_row(
+                stage.name, str(stage.order), f'{stage.calls:,}',
+                f'{stage.average_time * 1000:.3f}ms', f'{stage.max_time * 1000:.3f}ms',
+            )
+        table = await table.render(loop=self.bot.loop)
+        await ctx.send(codeblock(table))
+
 
 def setup(bot):
     bot.add_cog(Administration(bot))
@@ -0,0 +1,5 @@
+from .cog import Currency
+
+
+def setup(bot):
+    bot.add_cog(Currency(bot))
@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from typing import List
+
+__all__ = ['ChannelActivity']
+
+
+class ChannelActivity:
+    """Tracks who has recently talked in each channel.
+
+    Both the amount of users remembered per channel and the amount of
+    channels are bounded; the least recently active are forgotten first.
+    """
+
+    def __init__(self, *, users_per_channel: int = 100, channels: int = 5000) -> None:
+        self.users_per_channel = users_per_channel
+        self.max_channels = channels
+
+        #: channel id -> (user id -> time of last message), oldest first
+        self.channels: 'OrderedDict[int, OrderedDict[int, float]]' = OrderedDict()
+
+    def touch(self, channel_id: int, user_id: int, when: float = None):
+        """Record that a user has talked in a channel."""
+        users = self.channels.get(channel_id)
+
+        if users is None:
+            users = self.channels[channel_id] = OrderedDict()
+            if len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+        else:
+            self.channels.move_to_end(channel_id)
+
+        users[user_id] = time.time() if when is None else when
+        users.move_to_end(user_id)
+
+        if len(users) > self.users_per_channel:
+            users.popitem(last=False)
+
+    def active(self, channel_id: int, within: float) -> List[int]:
+        """Return the ids of users that have talked in the last ``within`` seconds."""
+        users = self.channels.get(channel_id)
+        if not users:
+            return []
+
+        cutoff = time.time() - within
+        active = []
+
+        for user_id, last_active in reversed(users.items()):
+            if last_active < cutoff:
+                break
+            active.append(user_id)
+
+        return active
@@ -1,122 +1,27 @@
+import asyncio
+import logging
 import random
 import time
-from itertools import islice
-from typing import Any, Dict, List
 
 import discord
-from discord import User
 from discord.ext import commands
-from discord.ext.commands import BadArgument, BucketType, CheckFailure, MemberConverter, cooldown, is_owner
-from lifesaver.bot import Cog, Context, command
-from lifesaver.bot.storage import AsyncJSONStorage
+from discord.ext.commands import BucketType, CheckFailure, cooldown, guild_only, is_owner
+from lifesaver.bot import Cog, Context, command, group
 from lifesaver.utils.formatting import Table, codeblock, human_delta
 
-CURRENCY_NAME = 'treat'
-CURRENCY_NAME_PLURAL = 'treats'
-CURRENCY_SYMBOL = '\N{MEAT ON BONE}'
+from dog.pipeline import MessageFacts, message_stage
 
+from . import simulator
+from .activity import ChannelActivity
+from .manager import CurrencyManager, Wallet
+from .odds import (
+    PASSIVE_AMOUNT, SPIN_FEE, SPIN_REELS, STEAL_COOLDOWN, spin_outcome, steal_fine, steal_succeeded, steal_thresholds
+)
+from .utils import CURRENCY_NAME_PLURAL, CURRENCY_SYMBOL, currency, format, truncate_float
 
-# https://stackoverflow.com/a/783927/2491753
-def truncate_float(f: float, n: int = 2) -> str:
-    """Truncates/pads a float f to n decimal places without rounding."""
-    s = '{}'.format(f)
-    if 'e' in s or 'E' in s:
-        return '{0:.{1}f}'.format(f, n)
-    i, p, d = s.partition('.')
-    return '.'.join([i, (d + '0' * n)[:n]])
+__all__ = ['Currency']
 
-
-def format(amount: float, *, symbol: bool = False) -> str:
-    amount = truncate_float(amount)
-    if symbol:
-        return f'{amount} {CURRENCY_SYMBOL}'
-    return f'{amount} {CURRENCY_NAME}' if amount == 1.0 else f'{amount} {CURRENCY_NAME_PLURAL}'
-
-
-def currency(string: str) -> float:
-    try:
-        result = float(string)
-        if result == float('inf') or result <= 0:
-            raise BadArgument('Invalid amount.')
-        return result
-    except ValueError:
-        raise BadArgument('Invalid number.')
-
-
-def _wallet_mirror(key):
-    @property
-    def _generated(self):
-        return self.wallet[key]
-
-    @_generated.setter
-    def _generated(self, value):
-        self.wallet[key] = value
-
-    return _generated
-
-
-class Wallet:
-    def __init__(self, user: User, wallet: Dict[str, Any], *, manager: 'CurrencyManager'):
-        self.user = user
-        self.manager = manager
-        self.wallet = wallet
-
-    balance = _wallet_mirror('balance')
-    last_stole = _wallet_mirror('last_stole')
-    passive_chance = _wallet_mirror('passive_chance')
-    passive_cooldown = _wallet_mirror('passive_cooldown')
-
-    def add_passive(self, amount: float):
-        if self.passive_cooldown and (time.time() - self.passive_cooldown) < 60:
-            return False
-        self.passive_cooldown = time.time()
-        self.balance += amount
-
-    async def commit(self):
-        await self.manager.set_raw_wallet(self.user, self.wallet)
-
-    async def delete(self):
-        await self.manager.storage.delete(self.user.id)
-
-    @classmethod
-    async def convert(cls, ctx: Context, argument: str):
-        user = await MemberConverter().convert(ctx, argument)
-        cog: 'Currency' = ctx.cog
-        if not cog.manager.has_wallet(user):
-            raise BadArgument(f"{user} doesn't have a wallet. They can create one by sending `{ctx.prefix}register`.")
-        return cog.manager.get_wallet(user)
-
-
-class CurrencyManager:
-    def __init__(self, file, *, bot):
-        self.bot = bot
-        self.storage = AsyncJSONStorage(file, loop=bot.loop)
-
-    def has_wallet(self, user: User) -> bool:
-        return self.storage.get(user.id) is not None
-
-    def get_wallet(self, user: User) -> Wallet:
-        return Wallet(user, self.storage.get(user.id), manager=self)
-
-    async def set_raw_wallet(self, user: User, wallet: Dict[str, Any]):
-        await self.storage.put(user.id, wallet)
-
-    async def register(self, user: User):
-        """Creates a wallet for a user."""
-        await self.set_raw_wallet(user, {
-            'balance': 1.0,
-            'passive_chance': 0.3,
-            'passive_cooldown': None,
-            'last_stole': None,
-        })
-
-    def top(self, *, descending: bool = True) -> List[Wallet]:
-        def expander(entry):
-            user_id, wallet = entry
-            return Wallet(self.bot.get_user(int(user_id)), wallet, manager=self)
-
-        wallets = self.storage.all()
-        return sorted(map(expander, wallets.items()), key=lambda wallet: wallet.balance, reverse=descending)
+log = logging.getLogger(__name__)
 
 
 def invoker_has_wallet():
@@ -133,19 +38,60 @@ def invoker_has_wallet():
 class Currency(Cog):
     def __init__(self, bot):
         super().__init__(bot)
-        self.manager = CurrencyManager('currency.json', bot=bot)
-
-    async def on_message(self, msg: discord.Message):
-        if not msg.guild or msg.author.bot or self.bot.is_blacklisted(msg.author):
-            return
+        config = getattr(bot.config, 'currency', None) or {}
+        self.manager = CurrencyManager(
+            'currency.bin', bot=bot, legacy_file='currency.json',
+            flush_interval=config.get('flush_interval', 30.0),
+            flush_threshold=config.get('flush_threshold', 500),
+        )
 
+        #: how long (in seconds) someone is considered active after talking
+        self.rain_window = config.get('rain_window', 60 * 10)
+        self.activity = ChannelActivity()
+
+        interest = config.get('interest') or {}
+        self.interest_rate = interest.get('rate', 0)
+        self.interest_interval = interest.get('interval', 60 * 60 * 24)
+        self.interest_job = None
+        if self.interest_rate and not self.interest_rate > -1:
+            log.error('ignoring currency interest rate %r, it must be greater than -1', self.interest_rate)
+        elif self.interest_rate:
+            self.interest_job = bot.loop.create_task(self.apply_interest_periodically())
+
+    def __unload(self):
+        if self.interest_job is not None:
+            self.interest_job.cancel()
+        self.bot.loop.create_task(self.manager.close())
+
+    async def apply_interest_periodically(self):
+        while True:
+            await asyncio.sleep(self.interest_interval)
+
+            try:
+                await self.manager.apply_interest(self.interest_rate)
+            except Exception:
+                log.exception('failed to apply interest')
+
+    @message_stage(guild_only=True, ignore_bots=True, ignore_blacklisted=True)
+    async def passive_income(self, msg: discord.Message, _facts: MessageFacts):
         if not self.manager.has_wallet(msg.author):
             return
 
+        self.activity.touch(msg.channel.id, msg.author.id)
+
         wallet = self.manager.get_wallet(msg.author)
         if random.random() > (1.0 - wallet.passive_chance):
-            wallet.add_passive(0.3)
-            await wallet.commit()
+            if wallet.add_passive(PASSIVE_AMOUNT):
+                wallet.defer()
+
+    async def on_member_join(self, member: discord.Member):
+        self.manager.member_joined(member)
+
+    async def on_member_remove(self, member: discord.Member):
+        self.manager.member_left(member)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.manager.guild_left(guild)
 
     @command(hidden=True)
     @is_owner()
@@ -163,15 +109,10 @@ class Currency(Cog):
             await ctx.send("You cannot send money to yourself.")
             return
 
-        if amount > ctx.wallet.balance:
+        if not await self.manager.transfer(ctx.wallet, target, amount):
             await ctx.send(f"You don't have that much money, {ctx.author.mention}.")
             return
 
-        ctx.wallet.balance -= amount
-        target.balance += amount
-        await ctx.wallet.commit()
-        await target.commit()
-
         await ctx.send("Transaction completed.")
 
     @command()
@@ -215,38 +156,28 @@ class Currency(Cog):
             await ctx.send(f"{target.user} doesn't have that much money.")
             return
 
-        if thief.last_stole is not None and (time.time() - thief.last_stole) < 60 * 60 * 8:
-            jail_time = human_delta(60 * 60 * 8 - (time.time() - thief.last_stole))
+        if thief.last_stole is not None and (time.time() - thief.last_stole) < STEAL_COOLDOWN:
+            jail_time = human_delta(STEAL_COOLDOWN - (time.time() - thief.last_stole))
             await ctx.send(f"You can't steal yet, buddy. {jail_time} to go.")
             return
 
+        # there are no awaits between the checks above and the balance changes
+        # below, so nobody can spend this money out from under us
         thief.last_stole = time.time()
-        await thief.commit()
 
         message = ''
 
-        # chance #1: the amount of coins that the victim has
-        # it gets easier to steal from someone with more coins, and vice versa
-        # bottoms out at 60% success by 9.4 coins -- TODO: this isn't desirable, tweak this later.
         chance_result = random.uniform(0, 10)
-        chance_threshold = max(-0.1 * (target.balance ** 2) + 9, 6)
-
-        # chance #2: the percentage of coins that the thief is trying to steal to the victim's wallet
-        #            (100% is the victim's entire wallet, 0% is none)
-        # stealing 10% is 90% chance, and stealing 100% is 0% chance (impossible)
-        percentage = amount / target.balance
         amount_result = random.random()
-        amount_threshold = 1 - (percentage ** 2)
+        chance_threshold, amount_threshold = steal_thresholds(target.balance, amount)
 
-        if chance_result > chance_threshold and amount_result < amount_threshold:
-            thief.balance += amount
-            target.balance -= amount
-            await thief.commit()
-            await target.commit()
+        if steal_succeeded(chance_result, amount_result, chance_threshold, amount_threshold):
+            await self.manager.transfer(target, thief, amount, kind='steal')
             flavor = ['Nice one.', 'Do you feel the guilt sinking in?', 'But why would you do that?', 'Pretty evil.']
             message = f"**Steal succeeded.** {random.choice(flavor)}"
         else:
-            new_balance = max(thief.balance - (amount / 2), 0)
+            new_balance = steal_fine(thief.balance, amount)
+            self.manager.ledger.record('steal_fine', sender_id=thief.user.id, amount=thief.balance - new_balance)
             thief.balance = new_balance
             await thief.commit()
             flavor = ['You deserved that.', "That's what you get.", "Welp.", "Better try again later?", "Ouch.",
@@ -288,6 +219,7 @@ class Currency(Cog):
         percent_increase = min((amount / 100) * 0.5, 0.5 - ctx.wallet.passive_chance)
         ctx.wallet.passive_chance += percent_increase
         ctx.wallet.balance -= amount
+        self.manager.ledger.record('donate', sender_id=ctx.author.id, amount=amount)
         await ctx.wallet.commit()
         await ctx.send(
             f'Your chance of gaining {CURRENCY_NAME_PLURAL} is now {truncate_float(ctx.wallet.passive_chance * 100)}% '
@@ -299,43 +231,77 @@ class Currency(Cog):
     @invoker_has_wallet()
     async def spin(self, ctx: Context):
         """Gamble your life away."""
-        fee = 0.5
-
-        if ctx.wallet.balance < fee:
-            await ctx.send(f"You need at least 0.5 {CURRENCY_SYMBOL} to spin.")
+        if ctx.wallet.balance < SPIN_FEE:
+            await ctx.send(f"You need at least {SPIN_FEE} {CURRENCY_SYMBOL} to spin.")
             return
 
-        emojis = ['\N{CHERRIES}', '\N{AUBERGINE}', '\N{TANGERINE}', '\N{LEMON}', '\N{GRAPES}', CURRENCY_SYMBOL]
-
-        results = [random.choice(emojis) for _ in range(3)]
+        results = [random.choice(SPIN_REELS) for _ in range(3)]
         results_formatted = ' '.join(results)
-        net = -fee
-        message = f"\N{NEUTRAL FACE} Nothing interesting."
-        is_triple = results.count(results[0]) == 3
-        is_two_in_a_row = results[0] == results[1] or results[1] == results[2]  # [X X o] or [o X X]
+        net, kind, reel = spin_outcome(results)
 
-        if is_triple and results[1] == CURRENCY_SYMBOL:
-            net = 3
+        if kind == 'triple_currency':
             message = f'\U0001f631 **TRIPLE {CURRENCY_SYMBOL}!**'
-        elif is_triple:
-            net = 2
-            message = f'\U0001f62e **TRIPLE!** You got 3 {results[1]}!'
-        elif is_two_in_a_row:
-            net = 1
-            message = f'\U0001f604 **Two in a row!** You got 2 {results[1]} in a row!'
+        elif kind == 'triple':
+            message = f'\U0001f62e **TRIPLE!** You got 3 {reel}!'
+        elif kind == 'two_in_a_row':
+            message = f'\U0001f604 **Two in a row!** You got 2 {reel} in a row!'
+        elif kind == 'double':
+            message = f'\U0001f642 **Double!** You got 2 {reel}!'
         else:
-            for result in results:
-                if results.count(result) == 2:
-                    net = 0.5
-                    message = f'\U0001f642 **Double!** You got 2 {result}!'
-                    break
+            message = "\N{NEUTRAL FACE} Nothing interesting."
 
         footer = (f'{message} You have lost {format(abs(net), symbol=True)}.' if net < 0 else
                   f'{message} You have gained {format(net, symbol=True)}.')
         await ctx.send(f"{ctx.author.mention}'s Slot Machine\n\n|  {results_formatted}  |\n\n{footer}")
         ctx.wallet.balance += net
+        if net < 0:
+            self.manager.ledger.record('spin', sender_id=ctx.author.id, amount=-net)
+        else:
+            self.manager.ledger.record('spin', recipient_id=ctx.author.id, amount=net)
         await ctx.wallet.commit()
 
+    @command(aliases=['airdrop'])
+    @guild_only()
+    @invoker_has_wallet()
+    async def rain(self, ctx: Context, amount: currency):
+        """
+        Makes it rain.
+
+        The amount is split evenly between everyone with a wallet who has recently talked in this channel.
+        """
+        recipients = [
+            self.manager.get_wallet(member)
+            for member in map(ctx.guild.get_member, self.activity.active(ctx.channel.id, self.rain_window))
+            if member is not None and member != ctx.author and self.manager.has_wallet(member)
+        ]
+
+        if not recipients:
+            await ctx.send("Nobody's around to catch it.")
+            return
+
+        if not await self.manager.distribute(ctx.wallet, recipients, amount):
+            await ctx.send(f"You don't have that much money, {ctx.author.mention}.")
+            return
+
+        share = format(amount / len(recipients), symbol=True)
+        await ctx.send(f'\N{CLOUD WITH RAIN} {len(recipients)} people each caught {share}.')
+
+    @command(hidden=True, typing=True)
+    @is_owner()
+    async def simulate(self, ctx: Context, rounds: int = 1_000_000, wallets: int = 10_000, days: int = 30):
+        """
+        Simulates the economy.
+
+        Runs millions of steals and spins through the real formulas and reports the expected value and variance
+        of each, along with how wealth is distributed over time in a simulated population of wallets.
+        """
+        lines = await self.bot.loop.run_in_executor(None, lambda: simulator.report(rounds, wallets=wallets, days=days))
+
+        ctx.new_paginator(prefix='```', suffix='```')
+        for line in lines:
+            ctx += line
+        await ctx.send_pages()
+
     @command()
     @invoker_has_wallet()
     async def delete(self, ctx: Context):
@@ -355,16 +321,35 @@ class Currency(Cog):
         await target.delete()
         await ctx.ok()
 
-    @command()
-    async def top(self, ctx: Context):
-        """Views the top users."""
-        table = Table('User', 'Balance', 'Chance')
-        for wallet in islice(self.manager.top(), 10):
+    async def send_leaderboard(self, ctx: Context, start: int, *, guild: discord.Guild = None):
+        offset = max(start, 1) - 1
+        wallets = self.manager.top(10, offset=offset, guild=guild)
+        if not wallets:
+            await ctx.send('Nobody is ranked that low.')
+            return
+
+        table = Table('#', 'User', 'Balance', 'Chance')
+        for rank, wallet in enumerate(wallets, offset + 1):
             chance = f"{truncate_float(wallet.passive_chance * 100)}%"
-            table.add_row(str(wallet.user) if wallet.user else '???', truncate_float(wallet.balance), chance)
+            table.add_row(str(rank), str(wallet.user) if wallet.user else '???', truncate_float(wallet.balance), chance)
         table = await table.render(loop=self.bot.loop)
         await ctx.send(codeblock(table))
 
+    @group(invoke_without_command=True)
+    async def top(self, ctx: Context, start: int = 1):
+        """
+        Views the top users.
+
+        You can view further down the leaderboard by passing the rank to start from.
+        """
+        await self.send_leaderboard(ctx, start)
+
+    @top.command(name='here')
+    @guild_only()
+    async def top_here(self, ctx: Context, start: int = 1):
+        """Views the top users in this server."""
+        await self.send_leaderboard(ctx, start, guild=ctx.guild)
+
     @command()
     @invoker_has_wallet()
     async def wallet(self, ctx: Context, *, target: Wallet = None):
@@ -372,7 +357,3 @@ class Currency(Cog):
         wallet = target or ctx.wallet
         chance = f"{wallet.passive_chance * 100}%"
         await ctx.send(f'{wallet.user} > {format(wallet.balance, symbol=True)} ({truncate_float(chance)} chance)')
-
-
-def setup(bot):
-    bot.add_cog(Currency(bot))
@@ -0,0 +1,137 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sortedcontainers import SortedList
+
+__all__ = ['Leaderboard', 'GuildLeaderboards']
+
+Key = Tuple[float, int]
+
+
+class Leaderboard:
+    """An incrementally maintained index of user ids ordered by balance.
+
+    Richer users come first, and ties are broken by user id so that the
+    order is stable. Updating a single balance costs O(log n), and fetching
+    ``k`` users at any offset costs O(log n + k).
+    """
+
+    def __init__(self, balances: Iterable[Tuple[int, float]] = ()) -> None:
+        self._keys: Dict[int, Key] = {user_id: (-balance, user_id) for user_id, balance in balances}
+        self._ranks = SortedList(self._keys.values())
+
+    def update(self, user_id: int, balance: float):
+        """Insert or move a user."""
+        key = (-balance, user_id)
+        old_key = self._keys.get(user_id)
+
+        if old_key == key:
+            return
+
+        if old_key is not None:
+            self._ranks.remove(old_key)
+
+        self._keys[user_id] = key
+        self._ranks.add(key)
+
+    def scale(self, factor: float):
+        """Multiply every balance by a positive factor.
+
+        Balances are clamped to zero, like they are in the wallet store.
+        """
+        if not factor > 0:
+            raise ValueError(f'Leaderboards can only be scaled by a positive factor, not {factor}')
+
+        self._keys = {user_id: (min(negated * factor, 0.0), user_id) for negated, user_id in self._ranks}
+        self._ranks = SortedList(self._keys.values())
+
+    def discard(self, user_id: int):
+        """Remove a user, if present."""
+        key = self._keys.pop(user_id, None)
+        if key is not None:
+            self._ranks.remove(key)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Return the zero-based rank of a user."""
+        key = self._keys.get(user_id)
+        if key is None:
+            return None
+        return self._ranks.index(key)
+
+    def top(self, limit: int = 10, *, offset: int = 0) -> List[int]:
+        """Return the ids of ``limit`` users, starting at ``offset``."""
+        return [user_id for _, user_id in self._ranks[offset:offset + limit]]
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._keys
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._ranks)
+
+
+class GuildLeaderboards:
+    """Leaderboards that only rank the members of a single guild.
+
+    A guild's leaderboard is built the first time it is requested, and from
+    then on it is kept up to date as members join and leave and as balances
+    change, so ranking a guild never needs to intersect the whole wallet
+    store with its member list again.
+    """
+
+    def __init__(self) -> None:
+        self.boards: Dict[int, Leaderboard] = {}
+
+        #: user id -> ids of the guild leaderboards they are indexed in
+        self.memberships: Dict[int, Set[int]] = defaultdict(set)
+
+    def build(self, guild_id: int, balances: Iterable[Tuple[int, float]]) -> Leaderboard:
+        board = self.boards[guild_id] = Leaderboard(balances)
+        for user_id in board:
+            self.memberships[user_id].add(guild_id)
+        return board
+
+    def get(self, guild_id: int) -> Optional[Leaderboard]:
+        return self.boards.get(guild_id)
+
+    def add_member(self, guild_id: int, user_id: int, balance: float):
+        """Add a member to a guild's leaderboard, if it has been built."""
+        board = self.boards.get(guild_id)
+        if board is None:
+            return
+        board.update(user_id, balance)
+        self.memberships[user_id].add(guild_id)
+
+    def remove_member(self, guild_id: int, user_id: int):
+        board = self.boards.get(guild_id)
+        if board is None:
+            return
+        board.discard(user_id)
+        self.memberships[user_id].discard(guild_id)
+
+    def update(self, user_id: int, balance: float):
+        """Move a user in every guild leaderboard that they are in."""
+        for guild_id in self.memberships.get(user_id, ()):
+            self.boards[guild_id].update(user_id, balance)
+
+    def discard(self, user_id: int):
+        """Remove a user from every guild leaderboard."""
+        for guild_id in self.memberships.pop(user_id, ()):
+            self.boards[guild_id].discard(user_id)
+
+    def scale(self, factor: float):
+        if not factor > 0:
+            raise ValueError(f'Leaderboards can only be scaled by a positive factor, not {factor}')
+
+        for board in self.boards.values():
+            board.scale(factor)
+
+    def drop(self, guild_id: int):
+        """Forget about a guild's leaderboard entirely."""
+        board = self.boards.pop(guild_id, None)
+        if board is None:
+            return
+        for user_id in board:
+            self.memberships[user_id].discard(guild_id)
@@ -0,0 +1,178 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+from typing import List, NamedTuple, Optional
+
+__all__ = ['Entry', 'Ledger']
+
+log = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class Entry(NamedTuple):
+    created_at: datetime.datetime
+    kind: str
+    sender_id: Optional[int]
+    recipient_id: Optional[int]
+    amount: float
+
+
+def _encode(entry: Entry) -> str:
+    return json.dumps([entry.created_at.strftime(TIMESTAMP_FORMAT), *entry[1:]])
+
+
+def _decode(line: str) -> Entry:
+    created_at, *fields = json.loads(line)
+    return Entry(datetime.datetime.strptime(created_at, TIMESTAMP_FORMAT), *fields)
+
+
+class Ledger:
+    """An append-only record of currency movements, stored in Postgres.
+
+    Entries are buffered in memory and inserted in batches with a single
+    ``COPY`` per flush, so recording an entry never waits on the database.
+    While there is no Postgres pool, or inserting fails, flushed entries are
+    appended to a local spill file (one JSON array per line) instead, and
+    are inserted along with the next flush that succeeds.
+
+    Entries are only dropped if even the spill file can't be written and
+    more than ``max_pending`` of them are waiting in memory; every drop is
+    counted and logged.
+    """
+
+    COLUMNS = list(Entry._fields)
+
+    def __init__(self, bot, *, spill_file: str = 'currency_ledger.jsonl', flush_interval: float = 10.0,
+                 batch_size: int = 250, max_pending: int = 10000) -> None:
+        self.bot = bot
+        self.spill_file = spill_file
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pending: List[Entry] = []
+
+        #: whether the last flush failed, so failures are only logged in full once
+        self.failing = False
+        self._warned_no_pool = False
+
+        #: entries dropped because too many were pending, since this was last logged
+        self.dropped = 0
+
+        #: whether the spill file has entries that haven't been inserted yet
+        self.spilled = os.path.exists(spill_file) and os.path.getsize(spill_file) > 0
+
+        self._lock = asyncio.Lock()
+        self._flusher = bot.loop.create_task(self._flush_periodically())
+
+    @property
+    def pool(self):
+        return getattr(self.bot, 'pool', None)
+
+    def record(self, kind: str, *, sender_id: int = None, recipient_id: int = None, amount: float):
+        """Append an entry to the ledger."""
+        self.pending.append(Entry(datetime.datetime.utcnow(), kind, sender_id, recipient_id, amount))
+        self._trim()
+
+        # while flushes are failing, leave retrying to the periodic flush
+        if len(self.pending) >= self.batch_size and not self._lock.locked() and not self.failing:
+            self.bot.loop.create_task(self.flush())
+
+    def _trim(self):
+        excess = len(self.pending) - self.max_pending
+        if excess > 0:
+            self.dropped += excess
+            del self.pending[:excess]
+
+    def _append_spill(self, entries: List[Entry]):
+        with open(self.spill_file, 'a') as fp:
+            fp.write(''.join(_encode(entry) + '\n' for entry in entries))
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _read_spill(self) -> List[Entry]:
+        with open(self.spill_file) as fp:
+            return [_decode(line) for line in fp if line.strip()]
+
+    def _clear_spill(self):
+        with open(self.spill_file, 'w'):
+            pass
+
+    async def _spill(self, entries: List[Entry]):
+        try:
+            await self.bot.loop.run_in_executor(None, self._append_spill, entries)
+        except OSError:
+            log.exception('failed to spill %d ledger entries to %s', len(entries), self.spill_file)
+
+            # keep them in memory instead, for as long as there's room
+            self.pending[:0] = entries
+            self._trim()
+            return
+
+        self.spilled = True
+
+    async def flush(self):
+        """Insert all pending (and spilled) entries."""
+        async with self._lock:
+            if self.dropped:
+                log.warning('dropped %d unflushed ledger entries (more than %d were pending)',
+                            self.dropped, self.max_pending)
+                self.dropped = 0
+
+            if not self.pending and not self.spilled:
+                return
+
+            entries, self.pending = self.pending, []
+
+            if self.pool is None:
+                if not self._warned_no_pool:
+                    log.warning('no postgres pool, currency ledger entries are kept in %s', self.spill_file)
+                    self._warned_no_pool = True
+                if entries:
+                    await self._spill(entries)
+                return
+
+            try:
+                spilled = await self.bot.loop.run_in_executor(None, self._read_spill) if self.spilled else []
+                async with self.pool.acquire() as conn:
+                    await conn.copy_records_to_table('currency_ledger', records=spilled + entries,
+                                                     columns=self.COLUMNS)
+            except Exception:
+                if self.failing:
+                    log.warning('still failing to flush the ledger (%d new entries)', len(entries))
+                else:
+                    log.exception('failed to flush %d ledger entries', len(entries))
+                self.failing = True
+
+                # spilled entries are still in the spill file
+                if entries:
+                    await self._spill(entries)
+                return
+
+            if spilled:
+                log.info('inserted %d spilled ledger entries', len(spilled))
+                try:
+                    await self.bot.loop.run_in_executor(None, self._clear_spill)
+                except OSError:
+                    # they'd be inserted twice otherwise
+                    log.exception('failed to clear %s after inserting it, clear it by hand', self.spill_file)
+                    raise
+                self.spilled = False
+
+            if self.failing:
+                log.info('flushed the ledger again')
+                self.failing = False
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception('failed to flush the ledger')
+
+    async def close(self):
+        self._flusher.cancel()
+        await self.flush()
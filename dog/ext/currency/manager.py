@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, List, Set
+
+import discord
+from discord import User
+from discord.ext.commands import BadArgument, CommandError, MemberConverter
+from lifesaver.bot import Context
+
+from .leaderboard import GuildLeaderboards, Leaderboard
+from .ledger import Ledger
+from .odds import PASSIVE_COOLDOWN
+from .store import COLUMNS, NULLABLE, WalletStore
+
+if TYPE_CHECKING:
+    from .cog import Currency
+
+__all__ = ['StaleWallet', 'Wallet', 'CurrencyManager']
+
+log = logging.getLogger(__name__)
+
+
+class StaleWallet(CommandError):
+    """Raised when a wallet is used after it was deleted."""
+
+    def __init__(self) -> None:
+        super().__init__('That wallet no longer exists.')
+
+
+def _wallet_column(key):
+    column = COLUMNS[key]
+    nullable = key in NULLABLE
+
+    @property
+    def _generated(self):
+        self.check()
+        value = getattr(self.manager.store, column)[self.slot]
+        if nullable and math.isnan(value):
+            return None
+        return value
+
+    @_generated.setter
+    def _generated(self, value):
+        self.check()
+        if nullable and value is None:
+            value = math.nan
+        getattr(self.manager.store, column)[self.slot] = value
+
+    return _generated
+
+
+class Wallet:
+    """A view over a single slot of the wallet store.
+
+    Using a wallet after it was deleted raises :class:`StaleWallet`, even if
+    its slot now belongs to someone else.
+    """
+
+    __slots__ = ('user', 'slot', 'generation', 'manager')
+
+    def __init__(self, user: User, slot: int, *, manager: 'CurrencyManager'):
+        self.user = user
+        self.slot = slot
+        self.generation = manager.store.generations[slot]
+        self.manager = manager
+
+    def check(self):
+        if self.manager.store.generations[self.slot] != self.generation:
+            raise StaleWallet()
+
+    balance = _wallet_column('balance')
+    last_stole = _wallet_column('last_stole')
+    passive_chance = _wallet_column('passive_chance')
+    passive_cooldown = _wallet_column('passive_cooldown')
+
+    def add_passive(self, amount: float):
+        if self.passive_cooldown and (time.time() - self.passive_cooldown) < PASSIVE_COOLDOWN:
+            return False
+        self.passive_cooldown = time.time()
+        self.balance += amount
+        return True
+
+    async def commit(self):
+        await self.manager.commit_many([self])
+
+    def defer(self):
+        """Schedules this wallet to be written with the next batch."""
+        self.manager.defer(self)
+
+    async def delete(self):
+        await self.manager.delete_wallet(self.user)
+
+    @classmethod
+    async def convert(cls, ctx: Context, argument: str):
+        user = await MemberConverter().convert(ctx, argument)
+        cog: 'Currency' = ctx.cog
+        if not cog.manager.has_wallet(user):
+            raise BadArgument(f"{user} doesn't have a wallet. They can create one by sending `{ctx.prefix}register`.")
+        return cog.manager.get_wallet(user)
+
+
+class CurrencyManager:
+    def __init__(self, file, *, bot, legacy_file: str = None, flush_interval: float = 30.0,
+                 flush_threshold: int = 500):
+        self.bot = bot
+        self.store = WalletStore(file, loop=bot.loop, legacy_file=legacy_file)
+        self.ledger = Ledger(bot)
+        self.leaderboard = Leaderboard(self.store.balances_by_user())
+        self.guild_leaderboards = GuildLeaderboards()
+
+        #: ids of users whose wallets were modified but haven't been written yet
+        self.dirty: Set[int] = set()
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._flush_scheduled = False
+        self._flusher = bot.loop.create_task(self._flush_periodically())
+
+    def defer(self, wallet: Wallet):
+        """Marks a wallet as dirty so that it is written by the next flush.
+
+        Flushes happen every ``flush_interval`` seconds, or as soon as
+        ``flush_threshold`` wallets are dirty.
+        """
+        self.dirty.add(wallet.user.id)
+        self._index(wallet.user.id, wallet.balance)
+
+        if len(self.dirty) >= self.flush_threshold and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.bot.loop.create_task(self.flush())
+
+    async def flush(self):
+        """Writes all dirty wallets in one batch."""
+        self._flush_scheduled = False
+
+        if not self.dirty:
+            return
+
+        dirty, self.dirty = self.dirty, set()
+        log.debug('flushing %d dirty wallet(s)', len(dirty))
+        await self.store.write(dirty)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            try:
+                await self.flush()
+            except Exception:
+                log.exception('failed to flush dirty wallets')
+
+    async def close(self):
+        """Stops periodic flushing and writes any remaining dirty wallets."""
+        self._flusher.cancel()
+        await self.flush()
+        await self.store.close()
+        await self.ledger.close()
+
+    def _index(self, user_id: int, balance: float):
+        self.leaderboard.update(user_id, balance)
+        self.guild_leaderboards.update(user_id, balance)
+
+    def has_wallet(self, user: User) -> bool:
+        return user.id in self.store
+
+    def get_wallet(self, user: User) -> Wallet:
+        return Wallet(user, self.store.slot_of(user.id), manager=self)
+
+    async def commit_many(self, wallets: List[Wallet]):
+        """Writes multiple wallets with a single append."""
+        for wallet in wallets:
+            self.dirty.discard(wallet.user.id)
+            self._index(wallet.user.id, wallet.balance)
+        await self.store.write(wallet.user.id for wallet in wallets)
+
+    async def transfer(self, sender: Wallet, recipient: Wallet, amount: float, *, kind: str = 'transfer') -> bool:
+        """Moves currency from one wallet to another.
+
+        The balance check and both balance changes happen without yielding to
+        the event loop, so concurrent transfers can't spend the same money
+        twice. Both wallets are then persisted together and the movement is
+        recorded in the ledger.
+
+        Returns whether the sender had enough money.
+        """
+        if sender.balance < amount:
+            return False
+
+        sender.balance -= amount
+        recipient.balance += amount
+        self.ledger.record(kind, sender_id=sender.user.id, recipient_id=recipient.user.id, amount=amount)
+        await self.commit_many([sender, recipient])
+        return True
+
+    async def distribute(self, sender: Wallet, recipients: List[Wallet], amount: float, *, kind: str = 'rain') -> bool:
+        """Splits currency evenly between multiple wallets.
+
+        Like :meth:`transfer`, every balance changes before anything is
+        awaited, and all wallets are persisted with a single write.
+
+        Returns whether the sender had enough money.
+        """
+        if not recipients or sender.balance < amount:
+            return False
+
+        share = amount / len(recipients)
+        sender.balance -= amount
+
+        for recipient in recipients:
+            recipient.balance += share
+            self.ledger.record(kind, sender_id=sender.user.id, recipient_id=recipient.user.id, amount=share)
+
+        await self.commit_many([sender, *recipients])
+        return True
+
+    async def apply_interest(self, rate: float):
+        """Applies interest (or decay, if negative) to every wallet at once.
+
+        Balances are updated in a single vectorized pass and then persisted
+        with one snapshot instead of a write per wallet. The rate must be
+        greater than -1, since anything else would zero or negate balances.
+        """
+        if not rate > -1:
+            raise ValueError(f'The interest rate must be greater than -1, not {rate}')
+
+        # records that are already encoded must land before the snapshot,
+        # or they would be replayed on top of it with pre-interest balances
+        await self.store.wait()
+
+        factor = 1 + rate
+        change = self.store.scale(factor)
+        self.leaderboard.scale(factor)
+        self.guild_leaderboards.scale(factor)
+        self.ledger.record('interest', amount=change)
+
+        await self.store.snapshot()
+        log.info('applied %.2f%% interest to %d wallet(s) (%+.2f)', rate * 100, len(self.store), change)
+
+    async def delete_wallet(self, user: User):
+        self.dirty.discard(user.id)
+        self.store.remove(user.id)
+        self.leaderboard.discard(user.id)
+        self.guild_leaderboards.discard(user.id)
+        await self.store.write([user.id])
+
+    async def register(self, user: User):
+        """Creates a wallet for a user."""
+        wallet = Wallet(user, self.store.allocate(user.id), manager=self)
+        wallet.balance = 1.0
+        wallet.passive_chance = 0.3
+
+        # enter the user into the leaderboards of the guilds they're in
+        for guild_id in list(self.guild_leaderboards.boards):
+            guild = self.bot.get_guild(guild_id)
+            if guild is not None and guild.get_member(user.id) is not None:
+                self.guild_leaderboards.add_member(guild_id, user.id, wallet.balance)
+
+        await wallet.commit()
+
+    def guild_leaderboard(self, guild: discord.Guild) -> Leaderboard:
+        """Returns the leaderboard for a guild's members, building it if needed."""
+        board = self.guild_leaderboards.get(guild.id)
+        if board is not None:
+            return board
+
+        balances = []
+        for member in guild.members:
+            slot = self.store.slot_of(member.id)
+            if slot is not None:
+                balances.append((member.id, self.store.balances[slot]))
+
+        return self.guild_leaderboards.build(guild.id, balances)
+
+    def member_joined(self, member: discord.Member):
+        slot = self.store.slot_of(member.id)
+        if slot is not None:
+            self.guild_leaderboards.add_member(member.guild.id, member.id, self.store.balances[slot])
+
+    def member_left(self, member: discord.Member):
+        self.guild_leaderboards.remove_member(member.guild.id, member.id)
+
+    def guild_left(self, guild: discord.Guild):
+        self.guild_leaderboards.drop(guild.id)
+
+    def top(self, limit: int = 10, *, offset: int = 0, guild: discord.Guild = None) -> List[Wallet]:
+        """Returns the richest wallets, using the leaderboard index.
+
+        If a guild is passed, only its members are ranked.
+        """
+        board = self.leaderboard if guild is None else self.guild_leaderboard(guild)
+        return [
+            Wallet(self.bot.get_user(user_id), self.store.slot_of(user_id), manager=self)
+            for user_id in board.top(limit, offset=offset)
+        ]
@@ -0,0 +1,80 @@
+"""The formulas behind passive income, stealing and spinning.
+
+These are shared by the cog and the economy simulator. Functions that
+take a ``maximum`` parameter work on plain floats by default, and on NumPy
+arrays when passed ``numpy.maximum``.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+from .utils import CURRENCY_SYMBOL
+
+__all__ = [
+    'PASSIVE_AMOUNT', 'PASSIVE_COOLDOWN', 'STEAL_COOLDOWN', 'SPIN_FEE', 'SPIN_REELS',
+    'steal_thresholds', 'steal_succeeded', 'steal_fine', 'spin_outcome',
+]
+
+#: the amount of currency granted by passive income
+PASSIVE_AMOUNT = 0.3
+
+#: the amount of seconds between passive income
+PASSIVE_COOLDOWN = 60
+
+#: the amount of seconds that a thief has to wait between steals
+STEAL_COOLDOWN = 60 * 60 * 8
+
+SPIN_FEE = 0.5
+SPIN_REELS = ['\N{CHERRIES}', '\N{AUBERGINE}', '\N{TANGERINE}', '\N{LEMON}', '\N{GRAPES}', CURRENCY_SYMBOL]
+
+
+def steal_thresholds(target_balance, amount, *, maximum=max):
+    """Return the chance and amount thresholds of a steal."""
+    # chance #1: the amount of coins that the victim has
+    # it gets easier to steal from someone with more coins, and vice versa
+    # bottoms out at 60% success by 9.4 coins -- TODO: this isn't desirable, tweak this later.
+    chance_threshold = maximum(-0.1 * (target_balance ** 2) + 9, 6)
+
+    # chance #2: the percentage of coins that the thief is trying to steal to the victim's wallet
+    #            (100% is the victim's entire wallet, 0% is none)
+    # stealing 10% is 90% chance, and stealing 100% is 0% chance (impossible)
+    percentage = amount / target_balance
+    amount_threshold = 1 - (percentage ** 2)
+
+    return chance_threshold, amount_threshold
+
+
+def steal_succeeded(chance_result, amount_result, chance_threshold, amount_threshold):
+    """Decide whether a steal succeeded.
+
+    ``chance_result`` is uniformly distributed in [0, 10), and
+    ``amount_result`` in [0, 1).
+    """
+    return (chance_result > chance_threshold) & (amount_result < amount_threshold)
+
+
+def steal_fine(thief_balance, amount, *, maximum=max):
+    """Return the balance of a thief after failing to steal."""
+    return maximum(thief_balance - (amount / 2), 0)
+
+
+def spin_outcome(results: Sequence[str]) -> Tuple[float, str, Optional[str]]:
+    """Score three spun reels.
+
+    Returns the net change in balance, the kind of outcome and the reel that
+    the outcome is about (if any).
+    """
+    is_triple = results.count(results[0]) == 3
+    is_two_in_a_row = results[0] == results[1] or results[1] == results[2]  # [X X o] or [o X X]
+
+    if is_triple and results[1] == CURRENCY_SYMBOL:
+        return 3, 'triple_currency', results[1]
+    elif is_triple:
+        return 2, 'triple', results[1]
+    elif is_two_in_a_row:
+        return 1, 'two_in_a_row', results[1]
+
+    for result in results:
+        if results.count(result) == 2:
+            return 0.5, 'double', result
+
+    return -SPIN_FEE, 'nothing', None
@@ -0,0 +1,232 @@
+"""Vectorized simulations of the currency economy.
+
+Everything here runs on the same formulas as the cog (see ``odds``), with
+all rounds of a simulation computed at once using NumPy.
+
+Run it offline with ``python -m dog.ext.currency.simulator``.
+"""
+
+import argparse
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+from .odds import (
+    PASSIVE_AMOUNT, SPIN_FEE, SPIN_REELS, STEAL_COOLDOWN, spin_outcome, steal_fine, steal_succeeded, steal_thresholds
+)
+
+__all__ = [
+    'SpinSummary', 'StealSummary', 'EconomySnapshot',
+    'spin_table', 'simulate_spins', 'simulate_steals', 'simulate_economy', 'report',
+]
+
+DAY = 60 * 60 * 24
+
+
+class SpinSummary(NamedTuple):
+    rounds: int
+    mean: float
+    variance: float
+
+    #: the exact expected value and variance, computed from every possible spin
+    exact_mean: float
+    exact_variance: float
+
+
+class StealSummary(NamedTuple):
+    victim_balance: float
+    fraction: float
+    success_rate: float
+    mean: float
+    variance: float
+
+
+class EconomySnapshot(NamedTuple):
+    day: int
+    total: float
+    mean: float
+    median: float
+    p90: float
+    p99: float
+    max: float
+    gini: float
+
+
+def spin_table() -> np.ndarray:
+    """Return the net outcome of every possible spin.
+
+    The outcome of reels ``(a, b, c)`` is at index ``(a * n + b) * n + c``,
+    where ``n`` is the amount of symbols on a reel.
+    """
+    return np.array([
+        spin_outcome([first, second, third])[0]
+        for first in SPIN_REELS
+        for second in SPIN_REELS
+        for third in SPIN_REELS
+    ])
+
+
+def _spin(table: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    n = len(SPIN_REELS)
+    reels = rng.integers(0, n, size=(count, 3))
+    return table[(reels[:, 0] * n + reels[:, 1]) * n + reels[:, 2]]
+
+
+def gini(balances: np.ndarray) -> float:
+    """Return the Gini coefficient of some balances (0 is perfect equality)."""
+    total = balances.sum()
+    if total <= 0:
+        return 0.0
+    ordered = np.sort(balances)
+    n = len(ordered)
+    ranks = np.arange(1, n + 1)
+    return float((2 * (ranks * ordered).sum()) / (n * total) - (n + 1) / n)
+
+
+def simulate_spins(rounds: int, *, rng: np.random.Generator) -> SpinSummary:
+    table = spin_table()
+    nets = _spin(table, rounds, rng)
+    return SpinSummary(rounds, float(nets.mean()), float(nets.var()), float(table.mean()), float(table.var()))
+
+
+def simulate_steals(rounds: int, *, rng: np.random.Generator, thief_balance: float = 10.0,
+                    victim_balances: Sequence[float] = (1, 2.5, 5, 10, 50),
+                    fractions: Sequence[float] = (0.1, 0.25, 0.5, 0.75)) -> List[StealSummary]:
+    """Simulate steal attempts against victims of varying wealth.
+
+    The net is the change in the thief's balance.
+    """
+    summaries = []
+
+    for victim_balance in victim_balances:
+        for fraction in fractions:
+            amount = victim_balance * fraction
+            chance_threshold, amount_threshold = steal_thresholds(victim_balance, amount)
+
+            succeeded = steal_succeeded(
+                rng.uniform(0, 10, rounds), rng.random(rounds), chance_threshold, amount_threshold,
+            )
+            fined = steal_fine(thief_balance, amount) - thief_balance
+            nets = np.where(succeeded, amount, fined)
+
+            summaries.append(StealSummary(
+                victim_balance, fraction, float(succeeded.mean()), float(nets.mean()), float(nets.var()),
+            ))
+
+    return summaries
+
+
+def _snapshot(day: int, balances: np.ndarray) -> EconomySnapshot:
+    p50, p90, p99 = np.percentile(balances, [50, 90, 99])
+    return EconomySnapshot(
+        day, float(balances.sum()), float(balances.mean()), float(p50), float(p90), float(p99),
+        float(balances.max()), gini(balances),
+    )
+
+
+def simulate_economy(wallets: int, days: int, *, rng: np.random.Generator, messages_per_day: int = 50,
+                     spins_per_day: int = 5, steal_probability: float = 0.1,
+                     steal_fraction: float = 0.25) -> List[EconomySnapshot]:
+    """Simulate a population of freshly registered wallets over time.
+
+    Every day, each user sends ``messages_per_day`` messages (in distinct
+    minutes, so none are lost to the passive income cooldown), spins
+    ``spins_per_day`` times if they can afford it, and tries to steal
+    ``steal_fraction`` of a random victim's wallet with a probability of
+    ``steal_probability`` whenever they are out of jail.
+    """
+    table = spin_table()
+    everyone = np.arange(wallets)
+    balances = np.ones(wallets)
+    chances = np.full(wallets, 0.3)
+    snapshots = [_snapshot(0, balances)]
+
+    for day in range(1, days + 1):
+        # passive income
+        balances += rng.binomial(messages_per_day, chances) * PASSIVE_AMOUNT
+
+        # spinning
+        for _ in range(spins_per_day):
+            can_afford = balances >= SPIN_FEE
+            balances += np.where(can_afford, _spin(table, wallets, rng), 0)
+
+        # stealing
+        for _ in range(DAY // STEAL_COOLDOWN):
+            victims = rng.integers(0, wallets, wallets)
+            victim_balances = balances[victims]
+            attempting = ((rng.random(wallets) < steal_probability)
+                          & (victims != everyone)
+                          & (victim_balances > 0))
+
+            # give non-attempts a harmless balance to avoid dividing by zero
+            victim_balances = np.where(attempting, victim_balances, 1)
+            amounts = victim_balances * steal_fraction
+            chance_threshold, amount_threshold = steal_thresholds(victim_balances, amounts, maximum=np.maximum)
+            succeeded = attempting & steal_succeeded(
+                rng.uniform(0, 10, wallets), rng.random(wallets), chance_threshold, amount_threshold,
+            )
+            failed = attempting & ~succeeded
+
+            np.subtract.at(balances, victims[succeeded], amounts[succeeded])
+            balances[succeeded] += amounts[succeeded]
+            balances[failed] = steal_fine(balances[failed], amounts[failed], maximum=np.maximum)
+
+            # several thieves can rob the same victim in one round
+            np.maximum(balances, 0, out=balances)
+
+        snapshots.append(_snapshot(day, balances))
+
+    return snapshots
+
+
+def report(rounds: int = 1_000_000, *, wallets: int = 10_000, days: int = 30, seed: int = None) -> List[str]:
+    """Run every simulation and return a human-readable report."""
+    rng = np.random.default_rng(seed)
+    lines = []
+
+    spins = simulate_spins(rounds, rng=rng)
+    lines += [
+        f'spin ({spins.rounds:,} rounds)',
+        f'  simulated: ev {spins.mean:+.4f}, var {spins.variance:.4f}',
+        f'  exact:     ev {spins.exact_mean:+.4f}, var {spins.exact_variance:.4f}',
+        '',
+        f'steal ({rounds:,} rounds each, thief has 10)',
+        f'  {"victim":>7} {"take":>5} {"success":>8} {"ev":>8} {"var":>8}',
+    ]
+
+    for steal in simulate_steals(rounds, rng=rng):
+        lines.append(
+            f'  {steal.victim_balance:>7g} {steal.fraction:>5.0%} {steal.success_rate:>8.2%} '
+            f'{steal.mean:>+8.3f} {steal.variance:>8.3f}'
+        )
+
+    lines += [
+        '',
+        f'economy ({wallets:,} wallets, {days} days)',
+        f'  {"day":>4} {"mean":>9} {"median":>9} {"p90":>9} {"p99":>9} {"max":>9} {"gini":>5}',
+    ]
+
+    snapshots = simulate_economy(wallets, days, rng=rng)
+    step = max(len(snapshots) // 10, 1)
+    for snapshot in snapshots[::step]:
+        lines.append(
+            f'  {snapshot.day:>4} {snapshot.mean:>9.2f} {snapshot.median:>9.2f} {snapshot.p90:>9.2f} '
+            f'{snapshot.p99:>9.2f} {snapshot.max:>9.2f} {snapshot.gini:>5.2f}'
+        )
+
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the currency economy.')
+    parser.add_argument('--rounds', type=int, default=1_000_000, help='rounds per spin/steal simulation')
+    parser.add_argument('--wallets', type=int, default=10_000, help='wallets in the economy simulation')
+    parser.add_argument('--days', type=int, default=30, help='days to run the economy simulation for')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    print('\n'.join(report(args.rounds, wallets=args.wallets, days=args.days, seed=args.seed)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import math
+import os
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from dog.storage import AsyncLogStorage
+
+__all__ = ['WalletStore']
+
+log = logging.getLogger(__name__)
+
+#: magic, version, capacity
+HEADER = struct.Struct('<4sII')
+MAGIC = b'DOGW'
+VERSION = 1
+
+#: op, user id, balance, passive chance, passive cooldown, last stole
+RECORD = struct.Struct('<BQdddd')
+OP_PUT = 0
+OP_DELETE = 1
+
+#: the column used for each field of a wallet
+COLUMNS = {
+    'balance': 'balances',
+    'passive_chance': 'passive_chances',
+    'passive_cooldown': 'passive_cooldowns',
+    'last_stole': 'last_stoles',
+}
+
+#: fields that can be None, which are stored as NaN
+NULLABLE = {'passive_cooldown', 'last_stole'}
+
+
+def _nullable(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+class WalletStore:
+    """Columnar storage for wallets.
+
+    Every field of every wallet lives in a typed array, and each user id maps
+    to a slot (an index into those arrays). Freed slots are reused, and are
+    marked with a user id of 0. Each slot also has a generation (kept in
+    memory only) that is bumped whenever it's freed, so views of a slot can
+    tell that the wallet they were made for is gone.
+
+    On disk, the store is a binary snapshot of the arrays followed by a
+    journal of fixed-size records, one per changed wallet. Writes only append
+    to the journal, and the snapshot is rewritten once the journal grows
+    larger than the store. If an append fails, the next write (or closing
+    the store) writes a snapshot instead, so the failed records aren't lost.
+
+    If neither file exists, wallets are imported from ``legacy_file`` (the
+    JSON wallet store that was used before).
+    """
+
+    def __init__(self, file: str, *, loop=None, legacy_file: str = None, compact_threshold: int = 10000) -> None:
+        self.file = file
+        self.journal_file = f'{file}.journal'
+        self.loop = loop or asyncio.get_event_loop()
+        self.compact_threshold = compact_threshold
+
+        self.slots: Dict[int, int] = {}
+        self.free: List[int] = []
+        self.user_ids = array('Q')
+        self.balances = array('d')
+        self.passive_chances = array('d')
+        self.passive_cooldowns = array('d')
+        self.last_stoles = array('d')
+        self.generations = array('I')
+
+        self._journaled = 0
+        self._pending: List[bytes] = []
+        self._batch = None
+        self._lock = asyncio.Lock()
+        self._compacting = False
+
+        #: whether an append failed, so the journal is missing records
+        self._needs_snapshot = False
+
+        self._load(legacy_file)
+
+    @property
+    def columns(self) -> Tuple[array, ...]:
+        return (self.user_ids, self.balances, self.passive_chances, self.passive_cooldowns, self.last_stoles)
+
+    def _load(self, legacy_file: Optional[str]):
+        if not os.path.exists(self.file) and not os.path.exists(self.journal_file):
+            if legacy_file is not None:
+                self._import_legacy(legacy_file)
+            return
+
+        if os.path.exists(self.file):
+            self._load_snapshot()
+
+        if os.path.exists(self.journal_file):
+            self._replay_journal()
+
+    def _load_snapshot(self):
+        with open(self.file, 'rb') as fp:
+            magic, version, capacity = HEADER.unpack(fp.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise RuntimeError(f'{self.file} is not a version {VERSION} wallet snapshot')
+
+            for column in self.columns:
+                column.fromfile(fp, capacity)
+
+        self.generations = array('I', [0]) * capacity
+
+        for slot, user_id in enumerate(self.user_ids):
+            if user_id:
+                self.slots[user_id] = slot
+            else:
+                self.free.append(slot)
+
+    def _replay_journal(self):
+        with open(self.journal_file, 'rb') as fp:
+            data = fp.read()
+
+        # ignore a torn record at the end
+        usable = len(data) - len(data) % RECORD.size
+
+        for op, user_id, *fields in RECORD.iter_unpack(data[:usable]):
+            if op == OP_DELETE:
+                self.remove(user_id)
+            else:
+                self._set(self.allocate(user_id), *fields)
+
+        self._journaled = usable // RECORD.size
+
+    def _import_legacy(self, legacy_file: str):
+        legacy = AsyncLogStorage(legacy_file, loop=self.loop)
+        wallets = legacy.all()
+
+        if not wallets:
+            return
+
+        log.info('importing %d wallet(s) from %s', len(wallets), legacy_file)
+
+        for user_id, wallet in wallets.items():
+            slot = self.allocate(int(user_id))
+            self._set(
+                slot, wallet['balance'], wallet['passive_chance'],
+                _nullable(wallet['passive_cooldown']), _nullable(wallet['last_stole']),
+            )
+
+        self._write_snapshot(self._snapshot())
+
+    def _set(self, slot: int, balance: float, passive_chance: float, passive_cooldown: float, last_stole: float):
+        self.balances[slot] = balance
+        self.passive_chances[slot] = passive_chance
+        self.passive_cooldowns[slot] = passive_cooldown
+        self.last_stoles[slot] = last_stole
+
+    def allocate(self, user_id: int) -> int:
+        """Return the slot of a user, allocating a zeroed one if necessary."""
+        slot = self.slots.get(user_id)
+        if slot is not None:
+            return slot
+
+        if self.free:
+            slot = self.free.pop()
+            self.user_ids[slot] = user_id
+        else:
+            slot = len(self.user_ids)
+            self.user_ids.append(user_id)
+            for column in self.columns[1:]:
+                column.append(0.0)
+            self.generations.append(0)
+
+        self._set(slot, 0.0, 0.0, math.nan, math.nan)
+        self.slots[user_id] = slot
+        return slot
+
+    def remove(self, user_id: int):
+        slot = self.slots.pop(user_id, None)
+        if slot is None:
+            return
+        self.user_ids[slot] = 0
+        self.generations[slot] += 1
+        self.free.append(slot)
+
+    def slot_of(self, user_id: int) -> Optional[int]:
+        return self.slots.get(user_id)
+
+    def balances_by_user(self) -> Iterator[Tuple[int, float]]:
+        return ((user_id, self.balances[slot]) for user_id, slot in self.slots.items())
+
+    def scale(self, factor: float) -> float:
+        """Multiply every balance by a factor in one vectorized pass.
+
+        Balances are clamped to zero. Returns the total change in balance.
+        """
+        live = np.frombuffer(self.user_ids, dtype=np.uint64) != 0
+        balances = np.frombuffer(self.balances, dtype=np.float64)
+
+        before = balances[live].sum()
+        balances[live] = np.maximum(balances[live] * factor, 0)
+        return float(balances[live].sum() - before)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.slots
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _encode(self, user_id: int) -> bytes:
+        slot = self.slots.get(user_id)
+        if slot is None:
+            return RECORD.pack(OP_DELETE, user_id, 0.0, 0.0, 0.0, 0.0)
+        return RECORD.pack(
+            OP_PUT, user_id, self.balances[slot], self.passive_chances[slot],
+            self.passive_cooldowns[slot], self.last_stoles[slot],
+        )
+
+    def _snapshot(self) -> bytes:
+        return HEADER.pack(MAGIC, VERSION, len(self.user_ids)) + b''.join(column.tobytes() for column in self.columns)
+
+    def _append(self, records: List[bytes]):
+        with open(self.journal_file, 'ab') as fp:
+            fp.write(b''.join(records))
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _write_snapshot(self, snapshot: bytes):
+        temporary = self.file + '.tmp'
+
+        with open(temporary, 'wb') as fp:
+            fp.write(snapshot)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        os.replace(temporary, self.file)
+
+        # everything in the journal is now part of the snapshot
+        with open(self.journal_file, 'wb'):
+            pass
+
+    async def write(self, user_ids: Iterable[int]):
+        """Persist the current state of some wallets.
+
+        Wallets that no longer exist are recorded as deleted. Concurrent
+        calls are grouped into a single append.
+        """
+        records = [self._encode(user_id) for user_id in user_ids]
+        if not records:
+            return
+
+        self._pending.extend(records)
+
+        if self._batch is None:
+            self._batch = self.loop.create_future()
+            self.loop.create_task(self._flush())
+
+        await asyncio.shield(self._batch)
+
+    async def _flush(self):
+        async with self._lock:
+            records, self._pending = self._pending, []
+            batch, self._batch = self._batch, None
+
+            try:
+                if self._needs_snapshot:
+                    # the snapshot includes these records
+                    await self._write_current_snapshot()
+                else:
+                    await self.loop.run_in_executor(None, self._append, records)
+                    self._journaled += len(records)
+            except Exception as error:
+                log.exception('failed to write %d wallet record(s), the next write will write a snapshot',
+                              len(records))
+                self._needs_snapshot = True
+                batch.set_exception(error)
+                return
+
+            batch.set_result(None)
+
+        if (not self._compacting and self._journaled >= self.compact_threshold
+                and self._journaled >= len(self.slots)):
+            self.loop.create_task(self._compact())
+
+    async def _compact(self):
+        # flushes keep scheduling compactions until the journal is
+        # truncated, so only let one of them run
+        if self._compacting:
+            return
+
+        self._compacting = True
+
+        try:
+            await self.snapshot()
+        finally:
+            self._compacting = False
+
+    async def _write_current_snapshot(self):
+        # the lock must be held
+        await self.loop.run_in_executor(None, self._write_snapshot, self._snapshot())
+        self._journaled = 0
+        self._needs_snapshot = False
+
+    async def snapshot(self):
+        """Write a fresh snapshot of every wallet and truncate the journal."""
+        async with self._lock:
+            await self._write_current_snapshot()
+
+    async def wait(self):
+        """Wait for all pending writes to hit the disk."""
+        if self._batch is not None:
+            await asyncio.shield(self._batch)
+
+    async def close(self):
+        try:
+            await self.wait()
+        finally:
+            if self._needs_snapshot:
+                await self.snapshot()
@@ -0,0 +1,34 @@
+from discord.ext.commands import BadArgument
+
+__all__ = ['CURRENCY_NAME', 'CURRENCY_NAME_PLURAL', 'CURRENCY_SYMBOL', 'truncate_float', 'format', 'currency']
+
+CURRENCY_NAME = 'treat'
+CURRENCY_NAME_PLURAL = 'treats'
+CURRENCY_SYMBOL = '\N{MEAT ON BONE}'
+
+
+# https://stackoverflow.com/a/783927/2491753
+def truncate_float(f: float, n: int = 2) -> str:
+    """Truncates/pads a float f to n decimal places without rounding."""
+    s = '{}'.format(f)
+    if 'e' in s or 'E' in s:
+        return '{0:.{1}f}'.format(f, n)
+    i, p, d = s.partition('.')
+    return '.'.join([i, (d + '0' * n)[:n]])
+
+
+def format(amount: float, *, symbol: bool = False) -> str:
+    amount = truncate_float(amount)
+    if symbol:
+        return f'{amount} {CURRENCY_SYMBOL}'
+    return f'{amount} {CURRENCY_NAME}' if amount == 1.0 else f'{amount} {CURRENCY_NAME_PLURAL}'
+
+
+def currency(string: str) -> float:
+    try:
+        result = float(string)
+        if result == float('inf') or result <= 0:
+            raise BadArgument('Invalid amount.')
+        return result
+    except ValueError:
+        raise BadArgument('Invalid number.')
@@ -0,0 +1,232 @@
+"""Perceptual avatar hashes, for blocking avatars that raiders reuse.
+
+Avatars are hashed with a difference hash (dHash): the image is shrunk to a
+9x8 grayscale thumbnail, and each bit of the 64-bit hash records whether a
+pixel is brighter than its neighbour. Small edits (recompression, resizing,
+a tint, a few scribbles) only flip a few bits, so similar avatars are the
+ones whose hashes are within a small Hamming distance of each other.
+
+Blocked hashes are kept in a multi-index hash table, so finding a similar
+hash doesn't compare against every blocked hash. Downloaded avatars and their hashes are
+cached, and hashing runs in an executor.
+"""
+
+__all__ = ['HASH_SIZE', 'dhash', 'hamming', 'format_hash', 'parse_hash', 'MultiIndex', 'AvatarBlocklist',
+           'AvatarUnavailable', 'AvatarCache', 'cache']
+
+import asyncio
+import collections
+import io
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import aiohttp
+import discord
+from PIL import Image
+
+#: the width and height of the grid that is hashed, giving HASH_SIZE ** 2 bits
+HASH_SIZE = 8
+
+
+def dhash(data: bytes, *, size: int = HASH_SIZE) -> int:
+    """Compute the difference hash of an image."""
+    with Image.open(io.BytesIO(data)) as image:
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # flatten transparency onto white, so transparent pixels don't
+            # hash as whatever colour they happen to hide
+            image = image.convert('RGBA')
+            background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image)
+
+        thumbnail = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+        pixels = list(thumbnail.getdata())
+
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for column in range(size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def format_hash(value: int) -> str:
+    return f'{value:0{HASH_SIZE ** 2 // 4}x}'
+
+
+def parse_hash(value: Union[str, int]) -> int:
+    if isinstance(value, bool):
+        raise TypeError(f'{value!r} is not an avatar hash')
+    if isinstance(value, int):
+        parsed = value
+    elif isinstance(value, str):
+        parsed = int(value, 16)
+    else:
+        raise TypeError(f'{value!r} is not an avatar hash')
+
+    if not 0 <= parsed < 1 << HASH_SIZE ** 2:
+        raise ValueError(f'{value!r} is not a {HASH_SIZE ** 2}-bit avatar hash')
+    return parsed
+
+
+def _chunks(parts: int) -> List[Tuple[int, int]]:
+    """Split the bits of a hash into ``(shift, mask)`` of nearly equal chunks."""
+    bits = HASH_SIZE ** 2
+    parts = max(1, min(parts, bits))
+    chunks = []
+    start = 0
+
+    for part in range(parts):
+        width = bits // parts + (part < bits % parts)
+        chunks.append((start, (1 << width) - 1))
+        start += width
+
+    return chunks
+
+
+class MultiIndex:
+    """A multi-index hash table of hashes, for finding the ones within a Hamming distance.
+
+    The bits of each hash are split into ``max_distance + 1`` chunks, and
+    each chunk gets a table. Two hashes that differ in at most
+    ``max_distance`` bits can't differ in every chunk, so only the hashes
+    that share a chunk exactly with the query need to be compared.
+    """
+
+    __slots__ = ('max_distance', 'chunks', 'tables')
+
+    def __init__(self, hashes: Iterable[int], max_distance: int) -> None:
+        self.max_distance = max_distance
+        self.chunks = _chunks(max_distance + 1)
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in self.chunks]
+
+        for value in hashes:
+            for (shift, mask), table in zip(self.chunks, self.tables):
+                table.setdefault((value >> shift) & mask, []).append(value)
+
+    def nearest(self, value: int) -> Optional[Tuple[int, int]]:
+        """Find the closest hash within the distance, as ``(distance, hash)``."""
+        best: Optional[Tuple[int, int]] = None
+        seen = set()
+
+        for (shift, mask), table in zip(self.chunks, self.tables):
+            for candidate in table.get((value >> shift) & mask, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+
+                distance = hamming(value, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+                    if distance == 0:
+                        return best
+
+        return best
+
+
+class AvatarBlocklist:
+    """The blocked avatar hashes of a guild, converted from a list of hex strings.
+
+    An index is built for each distance that is searched with, which is
+    usually just the one in the guild's configuration.
+    """
+
+    __slots__ = ('hashes', 'indexes')
+
+    def __init__(self, hashes: Iterable[Union[str, int]] = ()) -> None:
+        if isinstance(hashes, (str, int)):
+            raise TypeError('Avatar hashes must be a list')
+
+        self.hashes = frozenset(parse_hash(value) for value in hashes)
+        self.indexes: Dict[int, MultiIndex] = {}
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def nearest(self, value: int, max_distance: int) -> Optional[Tuple[int, int]]:
+        """Find the closest blocked hash within a distance, as ``(distance, hash)``."""
+        if value in self.hashes:
+            return 0, value
+        if max_distance <= 0 or not self.hashes:
+            return None
+
+        index = self.indexes.get(max_distance)
+        if index is None:
+            index = self.indexes[max_distance] = MultiIndex(self.hashes, max_distance)
+
+        return index.nearest(value)
+
+
+class AvatarUnavailable(Exception):
+    """Raised when avatars can't be downloaded at all, because there is no session."""
+
+
+class AvatarCache:
+    """Downloads and hashes avatars, caching both by avatar URL.
+
+    Downloads give up after ``timeout`` seconds, raising
+    :class:`asyncio.TimeoutError`.
+    """
+
+    def __init__(self, *, max_avatars: int = 256, max_hashes: int = 4096, timeout: float = 5.0) -> None:
+        #: set by the Gatekeeper cog when it's loaded
+        self.session: Optional[aiohttp.ClientSession] = None
+
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_avatars = max_avatars
+        self.max_hashes = max_hashes
+        self.avatars = collections.OrderedDict()
+        self.hashes = collections.OrderedDict()
+
+    @staticmethod
+    def _remember(lru: collections.OrderedDict, key, value, limit: int):
+        lru[key] = value
+        lru.move_to_end(key)
+        while len(lru) > limit:
+            lru.popitem(last=False)
+
+    @staticmethod
+    def url(user: discord.User) -> Optional[str]:
+        if user.avatar is None:
+            return None
+        # dHash only needs a tiny image anyway
+        return user.avatar_url_as(format='png', size=64)
+
+    async def read(self, url: str) -> bytes:
+        data = self.avatars.get(url)
+        if data is not None:
+            self.avatars.move_to_end(url)
+            return data
+
+        if self.session is None:
+            raise AvatarUnavailable('Avatars cannot be downloaded right now')
+
+        async with self.session.get(url, timeout=self.timeout) as resp:
+            resp.raise_for_status()
+            data = await resp.read()
+
+        self._remember(self.avatars, url, data, self.max_avatars)
+        return data
+
+    async def hash(self, user: discord.User) -> Optional[int]:
+        """Compute the perceptual hash of a user's avatar, or None if they don't have one."""
+        url = self.url(user)
+        if url is None:
+            return None
+
+        value = self.hashes.get(url)
+        if value is not None:
+            self.hashes.move_to_end(url)
+            return value
+
+        data = await self.read(url)
+        value = await asyncio.get_event_loop().run_in_executor(None, dhash, data)
+
+        self._remember(self.hashes, url, value, self.max_hashes)
+        return value
+
+
+#: shared by every guild, since avatars aren't guild specific
+cache = AvatarCache()
@@ -1,51 +1,75 @@
 __all__ = ['gatekeeper_check', 'block_default_avatars', 'block_bots',
-           'minimum_creation_time', 'block_all', 'username_regex']
+           'minimum_creation_time', 'block_all', 'username_regex', 'block_similar_avatars']
 
+import asyncio
 import datetime
 import inspect
 import functools
+import logging
 import re
 import typing
 
+import aiohttp
 import discord
 
+from dog.ext.gatekeeper import avatars
 from dog.ext.gatekeeper.core import Block, Report
 
+log = logging.getLogger(__name__)
 
 CheckOptions = typing.Dict[str, typing.Any]
 
+#: converters for annotations that aren't types, and can't be called to
+#: convert a value
+CONVERTERS = {
+    typing.Pattern: re.compile,
+}
+
 
 def convert_options(check, parameters, options: CheckOptions) -> typing.List[typing.Any]:
     params = []
 
-    for name, param in parameters.items():
-        # do not attempt to convert the first parameter
-        if name == 'member':
+    # do not attempt to convert the first parameter (the member)
+    for name, param in list(parameters.items())[1:]:
+        if param.kind is param.KEYWORD_ONLY:
+            # provided by the keeper, not the configuration
             continue
 
-        value = options.get(name)
+        value = options.get(name) if isinstance(options, dict) else None
         if value is None:
             raise Report(f'`{check.__name__}` is missing the `{name}` option.')
 
         annotation = param.annotation
-        if annotation is inspect.Parameter.empty or isinstance(value, annotation):
+        converter = CONVERTERS.get(annotation, annotation)
+
+        if annotation is inspect.Parameter.empty or (isinstance(annotation, type) and isinstance(value, annotation)):
             # just add the param if we don't need to convert or if the value is
             # already the desired type
             params.append(value)
-        else:
-            # convert the value by calling the annotation
-            params.append(annotation(value))
+            continue
+
+        # convert the value by calling the annotation
+        try:
+            params.append(converter(value))
+        except (TypeError, ValueError, re.error) as error:
+            raise Report(f'The `{name}` option of `{check.__name__}` is invalid. (`{error}`)')
 
     return params
 
 
 def gatekeeper_check(func):
-    """Register a function as a Gatekeeper check."""
+    """Register a function as a Gatekeeper check.
+
+    Positional parameters after the member are options, converted from the
+    configuration. Keyword-only parameters are resources that the
+    :class:`~dog.ext.gatekeeper.cog.Keeper` passes in, like ``avatar_cache``.
+    """
+
+    # resolved once, instead of on every join
+    parameters = inspect.signature(func).parameters
 
     @functools.wraps(func)
     async def wrapped(member: discord.Member, options: CheckOptions) -> None:
-        parameters = inspect.signature(func).parameters
-
         # only pass the options dict to the function if it accepts it
         if len(parameters) == 1:
             await discord.utils.maybe_coroutine(func, member)
@@ -53,6 +77,9 @@ def gatekeeper_check(func):
             converted_options = convert_options(func, parameters, options)
             await discord.utils.maybe_coroutine(func, member, *converted_options)
 
+    wrapped.check = func
+    wrapped.parameters = parameters
+    wrapped.resources = tuple(name for name, param in parameters.items() if param.kind is param.KEYWORD_ONLY)
     return wrapped
 
 
@@ -82,9 +109,33 @@ def block_all(_member: discord.Member):
 
 
 @gatekeeper_check
-def username_regex(member: discord.Member, regex: str):
+def username_regex(member: discord.Member, regex: typing.Pattern):
+    if regex.search(member.name):
+        raise Block('Username matched regex')
+
+
+@gatekeeper_check
+async def block_similar_avatars(member: discord.Member, hashes: avatars.AvatarBlocklist, distance: int, *,
+                                avatar_cache: avatars.AvatarCache):
+    if member.avatar is None:
+        return
+
+    # don't bounce people because their avatar couldn't be downloaded
     try:
-        if re.search(regex, member.name):
-            raise Block('Username matched regex')
-    except re.error as err:
-        raise Report(f"Invalid regex. (`{err}`)")
+        avatar_hash = await avatar_cache.hash(member)
+    except avatars.AvatarUnavailable as error:
+        log.warning('not checking the avatar of %d: %s', member.id, error)
+        return
+    except asyncio.TimeoutError:
+        log.warning('timed out hashing the avatar of %d', member.id)
+        return
+    except (aiohttp.ClientError, OSError) as error:
+        log.warning('failed to hash the avatar of %d: %s', member.id, error)
+        return
+
+    if avatar_hash is None:
+        return
+
+    match = hashes.nearest(avatar_hash, distance)
+    if match is not None:
+        raise Block(f'Avatar is similar to a blocked avatar (`{avatars.format_hash(match[1])}`, distance {match[0]})')
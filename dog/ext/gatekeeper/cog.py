@@ -1,29 +1,81 @@
+import asyncio
 import datetime
-import io
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import aiohttp
 import discord
 from discord.ext import commands
 from lifesaver.bot import Cog, Context, group
 from lifesaver.utils import human_delta
-from ruamel.yaml import YAML
+from lifesaver.utils.formatting import Table, codeblock
 
-from dog.ext.gatekeeper import checks
+from dog.ext.gatekeeper import avatars
+from dog.ext.gatekeeper.compiled import CompiledCheck, compile_checks
 from dog.ext.gatekeeper.core import Block, Report
+from dog.ext.gatekeeper.raid import RaidGuard, RaidSettings
+from dog.ext.gatekeeper.reports import BOUNCE, JOIN, NOTICE, ReportBuffer, ReportEntry, render
+from dog.ext.gatekeeper.sweep import Sweep
 from dog.formatting import represent
-
-CHECKS = list(map(checks.__dict__.get, checks.__all__))
+from dog.guild_config import GuildConfig, config_compiler
 
 log = logging.getLogger(__name__)
 
+#: how many bits of a hash can differ for an avatar to be blocked, by default
+DEFAULT_DISTANCE = 6
+
+MISCONFIGURED = ("Gatekeeper was incorrectly configured. I'm not sure what "
+                 "to do, so I'll just prevent this user from joining just "
+                 "in case.")
+
+AVATAR_CHECK_PATH = ['gatekeeper', 'checks', 'block_similar_avatars']
+
+
+def block_avatar_operations(options: Any, avatar_hash: str) -> List[Tuple[str, List[str], Any]]:
+    """Return the configuration operations that block an avatar hash.
+
+    The ``block_similar_avatars`` check is created, or enabled and given a
+    distance if it's missing one. Raises :class:`ValueError` if the check's
+    options can't hold hashes.
+    """
+    path = AVATAR_CHECK_PATH
+
+    if options is None:
+        return [('add', path, {'hashes': [avatar_hash], 'distance': DEFAULT_DISTANCE})]
+
+    if not isinstance(options, dict) or not isinstance(options.get('hashes', []), list):
+        raise ValueError('`block_similar_avatars` is configured without a list of `hashes`.')
+
+    operations = []
+
+    if 'hashes' not in options:
+        operations.append(('add', path + ['hashes'], [avatar_hash]))
+    elif avatar_hash not in options['hashes']:
+        operations.append(('add', path + ['hashes', '-'], avatar_hash))
+
+    if options.get('enabled', True) is not True:
+        operations.append(('add', path + ['enabled'], True))
+
+    if 'distance' not in options:
+        operations.append(('add', path + ['distance'], DEFAULT_DISTANCE))
+
+    return operations
+
 
 class Keeper:
     """A class that gatekeeps members from guilds."""
-    def __init__(self, guild: discord.Guild, settings, *, bot) -> None:
+    def __init__(self, guild: discord.Guild, settings, *, checks: List[CompiledCheck], bot,
+                 buffers: Dict[int, ReportBuffer] = None, avatar_cache: avatars.AvatarCache = None) -> None:
         self.bot = bot
         self.guild = guild
         self.settings = settings
+        self.checks = checks
+
+        #: channel id -> report buffer; if None, reports are sent right away
+        self.buffers = buffers
+
+        #: passed to the checks that take them
+        self.resources = {'avatar_cache': avatar_cache or avatars.cache}
 
     @property
     def broadcast_channel(self) -> discord.TextChannel:
@@ -53,13 +105,9 @@ class Keeper:
             await member.send(bounce_message)
         except discord.HTTPException:
             if self.settings.get('echo_dm_failures', False):
-                await self.report(
-                    member,
-                    f'Failed to send bounce message to {represent(member)}.',
-                )
+                await self.notice(member, f'Failed to send bounce message to {represent(member)}.')
 
-    async def report(self, member: discord.Member, *args, **kwargs) -> Optional[discord.Message]:
-        """Send a message to the designated broadcast channel of a guild."""
+    def _reporting_channel(self, member: discord.Member) -> Optional[discord.TextChannel]:
         channel = self.broadcast_channel
 
         if not channel:
@@ -70,22 +118,61 @@ class Keeper:
             log.warning('broadcast channel is somewhere else, ignoring')
             return None
 
+        return channel
+
+    async def report(self, member: discord.Member, *args, **kwargs) -> Optional[discord.Message]:
+        """Send a message to the designated broadcast channel of a guild."""
+        channel = self._reporting_channel(member)
+        if channel is None:
+            return None
+
         try:
             return await channel.send(*args, **kwargs)
         except discord.Forbidden:
             return None
 
-    async def block(self, member: discord.Member, reason: str):
-        """Bounce a user from the guild."""
-        await self.send_bounce_message(member)
+    async def queue_report(self, member: discord.Member, entry: ReportEntry):
+        """Buffer a report, to be sent to the broadcast channel along with others."""
+        channel = self._reporting_channel(member)
+        if channel is None:
+            return
+
+        if self.buffers is None:
+            for message in render([entry]):
+                try:
+                    await channel.send(**message)
+                except discord.Forbidden:
+                    return
+            return
+
+        buffer = self.buffers.get(channel.id)
+        if buffer is None:
+            buffer = self.buffers[channel.id] = ReportBuffer(channel, loop=self.bot.loop, on_idle=self._forget_buffer)
+        buffer.add(entry)
+
+    def _forget_buffer(self, buffer: ReportBuffer):
+        if self.buffers.get(buffer.channel.id) is buffer:
+            del self.buffers[buffer.channel.id]
+
+    async def notice(self, member: discord.Member, text: str):
+        """Report something that went wrong."""
+        await self.queue_report(member, ReportEntry(NOTICE, represent(member), text, content=text))
 
+    async def kick(self, member: discord.Member, reason: str) -> Optional[discord.HTTPException]:
+        """Kick a member for failing a check, returning the error if it failed."""
         try:
             await member.kick(reason=f'Failed Gatekeeper check. {reason}')
         except discord.HTTPException as error:
-            await self.report(
-                member,
-                f"Failed to kick {represent(member)}: `{error}`",
-            )
+            return error
+        return None
+
+    async def block(self, member: discord.Member, reason: str):
+        """Bounce a user from the guild."""
+        await self.send_bounce_message(member)
+
+        error = await self.kick(member, reason)
+        if error is not None:
+            await self.notice(member, f"Failed to kick {represent(member)}: `{error}`")
         else:
             embed = discord.Embed(
                 color=discord.Color.red(),
@@ -101,42 +188,38 @@ class Keeper:
             embed.timestamp = datetime.datetime.utcnow()
             embed.set_thumbnail(url=member.avatar_url)
 
-            await self.report(member, embed=embed)
-
-    async def check(self, member: discord.Member):
-        """Check a member and bounce them if necessary."""
-        enabled_checks = self.settings.get('checks', {})
-
-        for check in CHECKS:
-            name = check.__name__
-            check_options = enabled_checks.get(name)
+            await self.queue_report(member, ReportEntry(
+                BOUNCE, f'Bounced {represent(member)}',
+                f'{reason}\nCreated {human_delta(member.created_at)} ago', embed=embed,
+            ))
 
-            # check not present
-            if check_options is None:
-                continue
-
-            if isinstance(check_options, dict):
-                if not check_options.get('enabled', True):
-                    continue
-            elif isinstance(check_options, bool):
-                if not check_options:
-                    continue
+    async def evaluate(self, member: discord.Member) -> Tuple[Optional[str], Optional[str]]:
+        """Run the checks against a member without acting on the result.
 
+        Returns why the member should be blocked (if they should be), and
+        what is wrong with the configuration (if something is).
+        """
+        for check in self.checks:
             try:
-                await check(member, check_options)
+                await check(member, self.resources)
             except Block as block:
-                await self.block(member, str(block))
-                return False
+                return str(block), None
             except Report as report:
                 # something went wrong
-                await self.report(member, str(report))
-                await self.block(
-                    member,
-                    ("Gatekeeper was incorrectly configured. I'm not sure what "
-                     "to do, so I'll just prevent this user from joining just "
-                     "in case.")
-                )
-                return False
+                return MISCONFIGURED, str(report)
+
+        return None, None
+
+    async def check(self, member: discord.Member):
+        """Check a member and bounce them if necessary."""
+        reason, problem = await self.evaluate(member)
+
+        if problem is not None:
+            await self.notice(member, problem)
+
+        if reason is not None:
+            await self.block(member, reason)
+            return False
 
         return True
 
@@ -144,7 +227,26 @@ class Keeper:
 class Gatekeeper(Cog):
     def __init__(self, bot):
         super().__init__(bot)
-        self.yaml = YAML()
+
+        #: guild id -> raid guard
+        self.raids: Dict[int, RaidGuard] = {}
+
+        #: channel id -> buffer of reports to send there
+        self.report_buffers: Dict[int, ReportBuffer] = {}
+
+        #: ids of the guilds that are being swept
+        self.sweeping = set()
+
+        avatars.cache.session = bot.session
+
+    def __unload(self):
+        avatars.cache.session = None
+
+        for guard in self.raids.values():
+            guard.cancel()
+
+        for buffer in self.report_buffers.values():
+            self.bot.loop.create_task(buffer.flush())
 
     async def __local_check(self, ctx: Context):
         if not ctx.guild:
@@ -167,6 +269,44 @@ class Gatekeeper(Cog):
         config = self.bot.guild_configs.get(guild) or {}
         return config.get('gatekeeper') or {}
 
+    @config_compiler('gatekeeper')
+    def compile_gatekeeper(self, settings, _config: GuildConfig) -> List[CompiledCheck]:
+        if not isinstance(settings, dict):
+            return []
+        return compile_checks(settings.get('checks'))
+
+    def checks(self, guild: discord.Guild) -> List[CompiledCheck]:
+        """Fetch the compiled Gatekeeper checks of a guild."""
+        return self.bot.guild_configs.artifact(guild, 'gatekeeper', [])
+
+    def keeper(self, guild: discord.Guild) -> Keeper:
+        return Keeper(guild, self.settings(guild), checks=self.checks(guild), bot=self.bot,
+                      buffers=self.report_buffers)
+
+    def raid_settings(self, guild: discord.Guild) -> Optional[RaidSettings]:
+        return RaidSettings.from_settings(self.settings(guild))
+
+    def is_allowed(self, member: discord.Member) -> bool:
+        """Return whether a member is allowed to bypass Gatekeeper."""
+        config = self.bot.guild_configs.get_compiled(member.guild)
+        return config is not None and config.is_gatekeeper_allowed(member)
+
+    def drop_report_buffer(self, channel_id: int):
+        buffer = self.report_buffers.pop(channel_id, None)
+        if buffer is not None:
+            buffer.cancel()
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        guard = self.raids.pop(guild.id, None)
+        if guard is not None:
+            guard.cancel()
+
+        for channel in guild.channels:
+            self.drop_report_buffer(channel.id)
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.drop_report_buffer(channel.id)
+
     async def on_member_join(self, member: discord.Member):
         await self.bot.wait_until_ready()
 
@@ -175,12 +315,25 @@ class Gatekeeper(Cog):
         if not settings.get('enabled', False):
             return
 
-        overridden = settings.get('allowed_users', [])
-        is_overridden = str(member) in overridden or member.id in overridden
+        problems = []
+        raid_settings = RaidSettings.from_settings(settings, problems=problems)
+        for problem in problems:
+            await self.keeper(member.guild).notice(member.guild.me, problem)
+
+        if raid_settings is not None:
+            guard = self.raids.get(member.guild.id)
+            if guard is None:
+                guard = self.raids[member.guild.id] = RaidGuard(member.guild, cog=self)
+
+            # during a raid, joins are processed (and reported) in batches
+            if guard.observe(member, raid_settings):
+                return
 
-        keeper = Keeper(member.guild, settings, bot=self.bot)
-        is_allowed = await keeper.check(member)
-        if not is_overridden and not is_allowed:
+        keeper = self.keeper(member.guild)
+
+        # allowed users skip the checks entirely, like they do during a raid
+        is_overridden = self.is_allowed(member)
+        if not is_overridden and not await keeper.check(member):
             return
 
         if settings.get('quiet', False):
@@ -189,12 +342,15 @@ class Gatekeeper(Cog):
         embed = discord.Embed(
             color=discord.Color.green(),
             title=f'{represent(member)} has joined',
-            description='This user has passed all Gatekeeper checks.'
+            description=('This user is allowed to bypass Gatekeeper.' if is_overridden
+                         else 'This user has passed all Gatekeeper checks.'),
         )
         embed.set_thumbnail(url=member.avatar_url)
         embed.timestamp = datetime.datetime.utcnow()
 
-        await keeper.report(member, embed=embed)
+        await keeper.queue_report(member, ReportEntry(
+            JOIN, f'{represent(member)} has joined', f'Created {human_delta(member.created_at)} ago', embed=embed,
+        ))
 
     @group(aliases=['gk'], hollow=True)
     async def gatekeeper(self, ctx: Context):
@@ -213,15 +369,12 @@ class Gatekeeper(Cog):
 
         if not settings:
             await ctx.send("Gatekeeper is unconfigured.")
+            return
 
-        config = ctx.bot.guild_configs.get(ctx.guild)
-        config['gatekeeper']['enabled'] = not config['gatekeeper']['enabled']
-        with io.StringIO() as buf:
-            self.yaml.indent(mapping=4, sequence=6, offset=4)
-            self.yaml.dump(config, buf)
-            await ctx.bot.guild_configs.write(ctx.guild, buf.getvalue())
+        enabled = not settings.get('enabled', False)
+        await ctx.bot.guild_configs.set(ctx.guild, ['gatekeeper', 'enabled'], enabled)
 
-        if config['gatekeeper']['enabled']:
+        if enabled:
             state = 'enabled'
         else:
             state = 'disabled'
@@ -248,4 +401,151 @@ class Gatekeeper(Cog):
             description=description
         )
 
+        guard = self.raids.get(ctx.guild.id)
+        if guard is not None and guard.active:
+            embed.add_field(
+                name='Raid mode',
+                value=(f'Active since {human_delta(guard.started_at)} ago. {guard.bounced:,} bounced, '
+                       f'{len(guard.queue):,} queued.'),
+            )
+
         await ctx.send(embed=embed)
+
+    @gatekeeper.command()
+    async def timings(self, ctx: Context):
+        """Views how long each enabled check has taken to run."""
+        compiled = self.checks(ctx.guild)
+
+        if not compiled:
+            await ctx.send('No checks are enabled.')
+            return
+
+        table = Table('Check', 'Runs', 'Average', 'Max')
+        for check in compiled:
+            table.add_row(
+                check.name, f'{check.calls:,}', f'{check.average_time * 1000:.3f}ms', f'{check.max_time * 1000:.3f}ms',
+            )
+
+        table = await table.render(loop=self.bot.loop)
+        await ctx.send(codeblock(table))
+
+    @gatekeeper.command()
+    async def sweep(self, ctx: Context, mode: str = None):
+        """
+        Runs Gatekeeper checks against everyone in this server.
+
+        Members who fail a check are kicked, without being sent the bounce message. Pass "dry" to only see who
+        would be kicked. The server owner, people who can ban, bots, and allowed users are skipped.
+        """
+        dry_run = mode in ('dry', 'dry-run', 'dryrun')
+
+        if ctx.guild.id in self.sweeping:
+            await ctx.send('A sweep is already running.')
+            return
+
+        keeper = self.keeper(ctx.guild)
+        if not keeper.checks:
+            await ctx.send('No checks are enabled.')
+            return
+
+        broken = [check for check in keeper.checks if check.error is not None]
+        if broken:
+            ctx.new_paginator(prefix='', suffix='')
+            ctx += "Some checks are misconfigured, so I won't sweep:"
+            for check in broken:
+                ctx += f'`{check.name}`: {check.error}'
+            await ctx.send_pages()
+            return
+
+        if not dry_run:
+            if not ctx.guild.me.guild_permissions.kick_members:
+                await ctx.send("I can't kick members.")
+                return
+
+            if not await ctx.confirm(title='Are you sure?',
+                                     message='Everyone who fails a check will be kicked.',
+                                     delete_after=True, cancellation_message='Cancelled.'):
+                return
+
+        def skip(member: discord.Member) -> bool:
+            return (member == ctx.guild.owner or member.bot or member.guild_permissions.ban_members
+                    or self.is_allowed(member))
+
+        # another sweep could've started while we were confirming
+        if ctx.guild.id in self.sweeping:
+            await ctx.send('A sweep is already running.')
+            return
+
+        # claimed before anything else is awaited, so nothing can sneak in
+        self.sweeping.add(ctx.guild.id)
+
+        try:
+            sweep = Sweep(keeper, list(ctx.guild.members), dry_run=dry_run, skip=skip)
+            message = await ctx.send(f'Sweeping {sweep.total:,} member(s)...')
+
+            async def progress(sweep: Sweep):
+                try:
+                    await message.edit(content=sweep.describe())
+                except discord.HTTPException:
+                    pass
+
+            await sweep.run(progress)
+        finally:
+            self.sweeping.discard(ctx.guild.id)
+
+        await progress(sweep)
+
+        if not sweep.problems and not sweep.blocked:
+            return
+
+        ctx.new_paginator(prefix='', suffix='')
+
+        for problem in sorted(sweep.problems):
+            ctx += f'Problem: {problem}'
+
+        if sweep.blocked:
+            ctx += 'Would be kicked:' if dry_run else 'Failed a check:'
+            for member, reason in sweep.blocked[:50]:
+                ctx += f'{represent(member)}: {reason}'
+            if len(sweep.blocked) > 50:
+                ctx += f'...and {len(sweep.blocked) - 50:,} more.'
+
+        await ctx.send_pages()
+
+    @gatekeeper.command()
+    async def blockavatar(self, ctx: Context, *, user: discord.User):
+        """
+        Blocks avatars that look like someone's avatar.
+
+        The avatar is added to the `block_similar_avatars` check, which is enabled if it isn't already.
+        """
+        checks = self.settings(ctx.guild).get('checks')
+        if not isinstance(checks, dict):
+            await ctx.send('Gatekeeper has no checks configured.')
+            return
+
+        try:
+            avatar_hash = await avatars.cache.hash(user)
+        except (avatars.AvatarUnavailable, asyncio.TimeoutError, aiohttp.ClientError, OSError):
+            await ctx.send("Failed to download that avatar.")
+            return
+
+        if avatar_hash is None:
+            await ctx.send("That user doesn't have an avatar.")
+            return
+
+        formatted = avatars.format_hash(avatar_hash)
+
+        try:
+            operations = block_avatar_operations(checks.get('block_similar_avatars'), formatted)
+        except ValueError as error:
+            await ctx.send(str(error))
+            return
+
+        if not operations:
+            await ctx.send('That avatar is already blocked.')
+            return
+
+        await ctx.bot.guild_configs.patch(ctx.guild, operations)
+
+        await ctx.send(f'Blocked avatars similar to `{formatted}`.')
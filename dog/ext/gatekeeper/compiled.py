@@ -0,0 +1,94 @@
+__all__ = ['CHECKS', 'CompiledCheck', 'compile_checks']
+
+import asyncio
+import time
+import typing
+
+import discord
+
+from dog.ext.gatekeeper import checks
+from dog.ext.gatekeeper.core import Report
+
+#: every Gatekeeper check, in the order that they run in
+CHECKS = [check for check in map(checks.__dict__.get, checks.__all__) if hasattr(check, 'check')]
+
+
+class CompiledCheck:
+    """A Gatekeeper check that is ready to run against members.
+
+    Its options are converted once, when the guild's configuration is
+    compiled. If they couldn't be, the check raises the :class:`Report`
+    describing why whenever it runs. Resources that the check takes are
+    picked out of the ``resources`` it's called with.
+    """
+
+    __slots__ = ('name', 'func', 'arguments', 'resources', 'is_coroutine', 'error', 'calls', 'total_time',
+                 'max_time')
+
+    def __init__(self, check, arguments: typing.Sequence[typing.Any] = (), *, error: Report = None) -> None:
+        self.name = check.__name__
+        self.func = check.check
+        self.arguments = tuple(arguments)
+        self.resources = check.resources
+        self.is_coroutine = asyncio.iscoroutinefunction(self.func)
+        self.error = error
+
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def average_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    async def __call__(self, member: discord.Member, resources: typing.Dict[str, typing.Any] = None):
+        if self.error is not None:
+            # a fresh exception, so the stored one doesn't pile up tracebacks
+            raise Report(str(self.error))
+
+        started = time.perf_counter()
+
+        try:
+            keywords = {name: resources[name] for name in self.resources} if self.resources else {}
+            result = self.func(member, *self.arguments, **keywords)
+            if self.is_coroutine:
+                await result
+        finally:
+            elapsed = time.perf_counter() - started
+            self.calls += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def __repr__(self):
+        return f'<CompiledCheck {self.name}>'
+
+
+def compile_checks(enabled_checks: typing.Any, *, available=CHECKS) -> typing.List[CompiledCheck]:
+    """Compile the enabled checks of a guild's Gatekeeper settings."""
+    if not isinstance(enabled_checks, dict):
+        return []
+
+    compiled = []
+
+    for check in available:
+        check_options = enabled_checks.get(check.__name__)
+
+        # check not present
+        if check_options is None:
+            continue
+
+        if isinstance(check_options, dict):
+            if not check_options.get('enabled', True):
+                continue
+        elif isinstance(check_options, bool):
+            if not check_options:
+                continue
+
+        try:
+            arguments = checks.convert_options(check, check.parameters, check_options)
+        except Report as report:
+            compiled.append(CompiledCheck(check, error=report))
+        else:
+            compiled.append(CompiledCheck(check, arguments))
+
+    return compiled
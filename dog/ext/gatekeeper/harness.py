@@ -0,0 +1,283 @@
+"""Replays members through Gatekeeper checks, offline.
+
+Members (synthetic, or recorded as JSON lines) are turned into stub members
+and run through the checks of a Gatekeeper configuration, exactly like
+they would be on join, except that nobody is kicked and nothing is sent.
+It reports how many joins per second the checks can handle, how long each
+check takes, and which members would have been blocked.
+
+Run it with ``python -m dog.ext.gatekeeper.harness config.yml``, where
+``config.yml`` is a guild configuration with a ``gatekeeper`` section (pass
+``--bare`` if the file is just the section itself). Members that are in
+``allowed_users`` skip the checks, like they do on join. Recorded members
+have one JSON object per line::
+
+    {"id": 1, "name": "someone", "discriminator": "0001", "bot": false,
+     "avatar": "a1b2c3", "created_at": "2018-06-01T12:00:00"}
+
+``created_at`` can also be a UNIX timestamp, or ``age`` (in seconds) can be
+given instead. Avatars are never downloaded; ``avatar_hash`` (a hex dHash)
+is used by checks that look at avatars, which skip members that don't have
+one.
+"""
+
+__all__ = ['StubMember', 'RecordedAvatars', 'ReplayResult', 'synthetic_members', 'load_members', 'load_settings',
+           'replay', 'report']
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from ruamel.yaml import YAML
+
+from dog.ext.gatekeeper import avatars
+from dog.ext.gatekeeper.cog import Keeper
+from dog.ext.gatekeeper.compiled import CompiledCheck, compile_checks
+from dog.guild_config import GuildConfig
+
+CDN = 'https://cdn.discordapp.com'
+
+
+def _parse_timestamp(text: str) -> datetime.datetime:
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f'Unknown timestamp format: {text!r}')
+
+
+class StubMember:
+    """Just enough of a member for Gatekeeper checks to run against."""
+
+    def __init__(self, id: int, name: str, discriminator: str = '0001', *, created_at: datetime.datetime,
+                 avatar: Optional[str] = None, avatar_hash: Optional[int] = None, bot: bool = False) -> None:
+        self.id = id
+        self.name = name
+        self.discriminator = discriminator
+        self.created_at = created_at
+        self.avatar = avatar
+        self.avatar_hash = avatar_hash
+        self.bot = bot
+        self.guild = None
+
+    @property
+    def default_avatar_url(self) -> str:
+        return f'{CDN}/embed/avatars/{int(self.discriminator) % 5}.png'
+
+    @property
+    def avatar_url(self) -> str:
+        return self.avatar_url_as()
+
+    def avatar_url_as(self, *, format: str = 'webp', size: int = 1024) -> str:
+        if self.avatar is None:
+            return self.default_avatar_url
+        return f'{CDN}/avatars/{self.id}/{self.avatar}.{format}?size={size}'
+
+    def __str__(self) -> str:
+        return f'{self.name}#{self.discriminator}'
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], *, now: datetime.datetime = None) -> 'StubMember':
+        now = now or datetime.datetime.utcnow()
+
+        if isinstance(record.get('created_at'), (int, float)):
+            created_at = datetime.datetime.utcfromtimestamp(record['created_at'])
+        elif 'created_at' in record:
+            created_at = _parse_timestamp(record['created_at'])
+        else:
+            created_at = now - datetime.timedelta(seconds=record.get('age', 0))
+
+        avatar_hash = record.get('avatar_hash')
+
+        return cls(
+            int(record['id']), str(record['name']), str(record.get('discriminator', '0001')),
+            created_at=created_at, avatar=record.get('avatar'),
+            avatar_hash=None if avatar_hash is None else avatars.parse_hash(avatar_hash),
+            bot=bool(record.get('bot', False)),
+        )
+
+
+class RecordedAvatars:
+    """Stands in for the avatar cache, using the hashes that members were recorded with."""
+
+    async def hash(self, user: StubMember) -> Optional[int]:
+        return user.avatar_hash if user.avatar is not None else None
+
+
+class ReplayResult(NamedTuple):
+    members: int
+    elapsed: float
+    checks: List[CompiledCheck]
+
+    #: members that would have been blocked, and why
+    blocked: List[Tuple[StubMember, str]]
+
+    #: problems with the configuration
+    problems: List[str]
+
+    #: members that skipped the checks because they're in allowed_users
+    allowed: int = 0
+
+    @property
+    def joins_per_second(self) -> float:
+        return self.members / self.elapsed if self.elapsed else float('inf')
+
+
+NAMES = ('alex', 'sam', 'kit', 'river', 'morgan', 'jo', 'quinn', 'ash', 'robin', 'sky')
+SPAM_NAMES = ('discord.gg/free', 'free nitro', 'spam bot', 'raid')
+
+
+def synthetic_members(count: int, *, seed: int = None, now: datetime.datetime = None) -> List[StubMember]:
+    """Generate members, some of whom look like they're part of a raid.
+
+    Raiders with avatars reuse a few avatars, with some bits of the hash flipped.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.datetime.utcnow()
+    raid_avatars = [rng.getrandbits(avatars.HASH_SIZE ** 2) for _ in range(3)]
+    members = []
+
+    for index in range(count):
+        raider = rng.random() < 0.2
+
+        if raider:
+            age = rng.uniform(0, 60 * 60 * 24)
+            name = f'{rng.choice(SPAM_NAMES)} {rng.randint(1, 999)}'
+        else:
+            age = rng.uniform(60 * 60 * 24, 60 * 60 * 24 * 365 * 3)
+            name = f'{rng.choice(NAMES)}{rng.randint(1, 99)}'
+
+        has_avatar = rng.random() < (0.2 if raider else 0.8)
+
+        if raider:
+            avatar_hash = rng.choice(raid_avatars)
+            for _ in range(rng.randint(0, 3)):
+                avatar_hash ^= 1 << rng.randrange(avatars.HASH_SIZE ** 2)
+        else:
+            avatar_hash = rng.getrandbits(avatars.HASH_SIZE ** 2)
+
+        members.append(StubMember(
+            index + 1, name, f'{rng.randint(1, 9999):04}',
+            created_at=now - datetime.timedelta(seconds=age),
+            avatar=f'{rng.getrandbits(128):032x}' if has_avatar else None,
+            avatar_hash=avatar_hash if has_avatar else None,
+            bot=rng.random() < 0.01,
+        ))
+
+    return members
+
+
+def load_members(path: str) -> List[StubMember]:
+    now = datetime.datetime.utcnow()
+    with open(path) as fp:
+        return [StubMember.from_record(json.loads(line), now=now) for line in fp if line.strip()]
+
+
+def load_settings(path: str, *, bare: bool = False) -> Dict[str, Any]:
+    """Load Gatekeeper settings from a guild configuration.
+
+    If ``bare`` is true, the file is just the ``gatekeeper`` section.
+    Raises :class:`ValueError` if there are no settings to load.
+    """
+    with open(path) as fp:
+        config = YAML(typ='safe').load(fp) or {}
+
+    if not isinstance(config, dict):
+        raise ValueError(f'{path} is not a mapping.')
+
+    if bare:
+        return config
+
+    settings = config.get('gatekeeper')
+    if not isinstance(settings, dict):
+        raise ValueError(f'{path} has no gatekeeper section (pass --bare if the file is just the section).')
+    return settings
+
+
+async def replay(settings: Dict[str, Any], members: Iterable[StubMember], *,
+                 avatar_cache=None) -> ReplayResult:
+    """Run members through the checks of some Gatekeeper settings, without acting on the results.
+
+    Avatar hashes come from ``avatar_cache`` (:class:`RecordedAvatars` by default) instead of
+    being downloaded.
+    """
+    checks = compile_checks(settings.get('checks'))
+    keeper = Keeper(None, settings, checks=checks, bot=None, avatar_cache=avatar_cache or RecordedAvatars())
+
+    # compiled the same way as a guild's configuration, so allowed_users
+    # matches exactly who it would on join
+    config = GuildConfig.compile(0, 0, '', {'gatekeeper': settings})
+
+    blocked = []
+    problems = set()
+    count = allowed = 0
+
+    started = time.perf_counter()
+    for member in members:
+        count += 1
+        if config.is_gatekeeper_allowed(member):
+            allowed += 1
+            continue
+        reason, problem = await keeper.evaluate(member)
+        if problem is not None:
+            problems.add(problem)
+        if reason is not None:
+            blocked.append((member, reason))
+    elapsed = time.perf_counter() - started
+
+    return ReplayResult(count, elapsed, checks, blocked, sorted(problems), allowed)
+
+
+def report(result: ReplayResult, *, show_blocked: int = 20) -> List[str]:
+    lines = [
+        f'members: {result.members:,} ({len(result.blocked):,} would be blocked, {result.allowed:,} allowed)',
+        f'throughput: {result.joins_per_second:,.0f} joins/sec',
+        '',
+    ]
+
+    for check in result.checks:
+        lines.append(
+            f'{check.name}: {check.calls:,} runs, avg {check.average_time * 1e6:.1f}us, '
+            f'max {check.max_time * 1e6:.1f}us'
+        )
+
+    for problem in result.problems:
+        lines.append(f'problem: {problem}')
+
+    if result.blocked and show_blocked:
+        lines.append('')
+        for member, reason in result.blocked[:show_blocked]:
+            lines.append(f'blocked {member} ({member.id}): {reason}')
+        if len(result.blocked) > show_blocked:
+            lines.append(f'...and {len(result.blocked) - show_blocked:,} more')
+
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay members through a Gatekeeper configuration.')
+    parser.add_argument('config', help='a guild configuration (YAML)')
+    parser.add_argument('--bare', action='store_true', help='the configuration is just the gatekeeper section')
+    parser.add_argument('--members', help='recorded members (JSON lines); synthetic members are used if omitted')
+    parser.add_argument('--count', type=int, default=10_000, help='synthetic members to generate')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--show-blocked', type=int, default=20, help='blocked members to list')
+    args = parser.parse_args()
+
+    try:
+        settings = load_settings(args.config, bare=args.bare)
+    except ValueError as error:
+        parser.error(str(error))
+    members = load_members(args.members) if args.members else synthetic_members(args.count, seed=args.seed)
+
+    result = asyncio.get_event_loop().run_until_complete(replay(settings, members))
+    print('\n'.join(report(result, show_blocked=args.show_blocked)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Raid mode.
+
+When members join a guild faster than a configured rate, Gatekeeper stops
+handling each join on its own (with a bounce message, a kick, and a report
+each). Instead, joins are queued and processed in batches: kicks run with
+bounded concurrency, and the broadcast channel receives one summary per
+batch of bounced members.
+
+Raid mode is configured in the ``gatekeeper`` section::
+
+    gatekeeper:
+        raid_mode:
+            joins: 10         # raid mode turns on when this many members join...
+            seconds: 10       # ...within this many seconds
+            cooldown: 60      # and turns off after this many seconds without joins
+            batch_size: 25    # members processed per batch
+            concurrency: 3    # kicks in flight at once
+            summary_every: 25 # bounces per summary
+            send_bounce_message: false
+
+``raid_mode: true`` uses the defaults above.
+"""
+
+__all__ = ['RaidSettings', 'JoinWindow', 'RaidGuard']
+
+import asyncio
+import collections
+import datetime
+import logging
+import time
+from typing import Deque, List, NamedTuple, Optional
+
+import discord
+
+from dog.formatting import represent
+
+log = logging.getLogger(__name__)
+
+
+class RaidSettings(NamedTuple):
+    joins: int = 10
+    seconds: float = 10.0
+    cooldown: float = 60.0
+    batch_size: int = 25
+    concurrency: int = 3
+    summary_every: int = 25
+
+    #: whether bounced members are sent the bounce message during a raid
+    send_bounce_message: bool = False
+
+    @classmethod
+    def from_settings(cls, settings, *, problems: List[str] = None) -> Optional['RaidSettings']:
+        """Read raid mode settings from Gatekeeper settings, if raid mode is enabled.
+
+        Invalid values are replaced with their defaults, and described in ``problems`` (if given).
+        """
+        raid_mode = settings.get('raid_mode')
+
+        if raid_mode is True:
+            return cls()
+        if not isinstance(raid_mode, dict) or not raid_mode.get('enabled', True):
+            return None
+
+        values = {}
+        for field, default in cls._field_defaults.items():
+            value = raid_mode.get(field, default)
+
+            # bool('false') is True, so booleans aren't coerced
+            if isinstance(default, bool):
+                valid = isinstance(value, bool)
+            else:
+                try:
+                    value = type(default)(value)
+                    valid = not isinstance(raid_mode.get(field), bool)
+                except (TypeError, ValueError):
+                    valid = False
+
+            if valid:
+                values[field] = value
+            else:
+                values[field] = default
+                if problems is not None:
+                    problems.append(f'The `{field}` option of raid mode is invalid. (`{raid_mode[field]!r}`)')
+
+        # no zeroes or negative numbers
+        for field in ('joins', 'batch_size', 'concurrency', 'summary_every'):
+            values[field] = max(1, values[field])
+
+        return cls(**values)
+
+
+class JoinWindow:
+    """Counts the joins within a sliding window of time."""
+
+    def __init__(self) -> None:
+        self.joins: Deque[float] = collections.deque()
+
+    def hit(self, window: float, now: float = None) -> int:
+        """Record a join, returning the amount of joins within the window."""
+        now = time.monotonic() if now is None else now
+        self.joins.append(now)
+
+        while self.joins and self.joins[0] <= now - window:
+            self.joins.popleft()
+
+        return len(self.joins)
+
+    @property
+    def last(self) -> Optional[float]:
+        return self.joins[-1] if self.joins else None
+
+
+class RaidGuard:
+    """Watches the join rate of a guild, and processes joins in batches during a raid."""
+
+    def __init__(self, guild: discord.Guild, *, cog) -> None:
+        self.guild = guild
+        self.cog = cog
+        self.loop = cog.bot.loop
+        self.window = JoinWindow()
+
+        self.active = False
+        self.started_at: Optional[datetime.datetime] = None
+        self.queue: Deque[discord.Member] = collections.deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+        #: totals for the current raid
+        self.bounced = 0
+        self.passed = 0
+        self.failed = 0
+
+        #: bounced members that haven't been summarized yet
+        self.unreported: List[discord.Member] = []
+
+    def observe(self, member: discord.Member, settings: RaidSettings) -> bool:
+        """Record a join, returning whether it was queued for raid processing."""
+        joins = self.window.hit(settings.seconds)
+
+        if not self.active and joins >= settings.joins:
+            self.activate()
+
+        if not self.active:
+            return False
+
+        self.queue.append(member)
+        self.wakeup.set()
+        return True
+
+    def activate(self):
+        log.info('raid mode activated in %d', self.guild.id)
+        self.active = True
+        self.started_at = datetime.datetime.utcnow()
+        self.bounced = self.passed = self.failed = 0
+        self.unreported = []
+        self.task = self.loop.create_task(self._run())
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def _run(self):
+        keeper = self.cog.keeper(self.guild)
+        await keeper.report(self.guild.me, embed=discord.Embed(
+            color=discord.Color.red(),
+            title='Raid mode activated',
+            description='Members are joining quickly, so joins will be processed in batches.',
+        ))
+
+        try:
+            while True:
+                if not self.cog.settings(self.guild).get('enabled', False):
+                    # gatekeeper was disabled in the middle of a raid
+                    self.queue.clear()
+                    break
+
+                settings = self.cog.raid_settings(self.guild) or RaidSettings()
+
+                if not self.queue:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=settings.cooldown)
+                    except asyncio.TimeoutError:
+                        pass
+
+                last = self.window.last
+                if not self.queue and (last is None or time.monotonic() - last >= settings.cooldown):
+                    break
+
+                batch = [self.queue.popleft() for _ in range(min(settings.batch_size, len(self.queue)))]
+                if not batch:
+                    continue
+
+                try:
+                    await self._process(self.cog.keeper(self.guild), batch, settings)
+                except Exception:
+                    log.exception('failed to process a batch of %d join(s) in %d', len(batch), self.guild.id)
+        finally:
+            # another raid can start while the final reports are being sent,
+            # and would reset these
+            bounced, passed, failed = self.bounced, self.passed, self.failed
+            unreported, self.unreported = self.unreported, []
+            self.active = False
+
+        keeper = self.cog.keeper(self.guild)
+        await self._send_summary(keeper, unreported, bounced)
+        await keeper.report(self.guild.me, embed=discord.Embed(
+            color=discord.Color.green(),
+            title='Raid mode deactivated',
+            description=f'Bounced {bounced:,}, let in {passed:,}, and failed to kick {failed:,} member(s).',
+        ))
+        log.info('raid mode deactivated in %d', self.guild.id)
+
+    async def _process(self, keeper, batch: List[discord.Member], settings: RaidSettings):
+        semaphore = asyncio.Semaphore(settings.concurrency)
+        problems = set()
+
+        async def handle(member: discord.Member):
+            if self.cog.is_allowed(member):
+                self.passed += 1
+                return
+
+            reason, problem = await keeper.evaluate(member)
+            if problem is not None:
+                problems.add(problem)
+
+            if reason is None:
+                self.passed += 1
+                return
+
+            async with semaphore:
+                if settings.send_bounce_message:
+                    await keeper.send_bounce_message(member)
+                error = await keeper.kick(member, reason)
+
+            if error is not None:
+                self.failed += 1
+            else:
+                self.bounced += 1
+                self.unreported.append(member)
+
+        await asyncio.gather(*(handle(member) for member in batch))
+
+        for problem in problems:
+            await keeper.notice(self.guild.me, problem)
+
+        while len(self.unreported) >= settings.summary_every:
+            await self._summarize(keeper, settings.summary_every)
+
+    async def _summarize(self, keeper, limit: int):
+        members, self.unreported = self.unreported[:limit], self.unreported[limit:]
+        await self._send_summary(keeper, members, self.bounced)
+
+    async def _send_summary(self, keeper, members: List[discord.Member], bounced: int):
+        if not members:
+            return
+
+        listing = '\n'.join(represent(member) for member in members)
+        if len(listing) > 2000:
+            listing = listing[:1997] + '...'
+
+        embed = discord.Embed(
+            color=discord.Color.red(),
+            title=f'Bounced {len(members):,} member(s) during a raid',
+            description=listing,
+        )
+        embed.set_footer(text=f'{bounced:,} bounced since raid mode was activated')
+        embed.timestamp = datetime.datetime.utcnow()
+
+        await keeper.report(self.guild.me, embed=embed)
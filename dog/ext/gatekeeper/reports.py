@@ -0,0 +1,167 @@
+"""Coalesced Gatekeeper reports.
+
+Instead of sending a message to the broadcast channel for every bounce,
+pass, and failure, reports are buffered per channel. When the buffer is
+flushed (after a short delay, or once it's full), a lone report is sent as
+is, and anything more is merged into digest embeds with a field per report.
+Bounces and notices are flushed sooner than routine join reports, and come
+first in a digest.
+"""
+
+__all__ = ['BOUNCE', 'NOTICE', 'JOIN', 'ReportEntry', 'ReportBuffer', 'render']
+
+import asyncio
+import datetime
+import itertools
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import discord
+
+log = logging.getLogger(__name__)
+
+#: kinds of reports, in the order that they're flushed in
+BOUNCE = 0
+NOTICE = 1
+JOIN = 2
+
+#: how long each kind of report can wait in a buffer, in seconds
+DELAYS = {
+    BOUNCE: 2.0,
+    NOTICE: 2.0,
+    JOIN: 10.0,
+}
+
+DIGEST_TITLES = {
+    BOUNCE: 'Bounced {count:,} member(s)',
+    NOTICE: '{count:,} notice(s)',
+    JOIN: '{count:,} member(s) passed all Gatekeeper checks',
+}
+
+DIGEST_COLORS = {
+    BOUNCE: discord.Color.red,
+    NOTICE: discord.Color.orange,
+    JOIN: discord.Color.green,
+}
+
+#: Discord allows 25 fields per embed, but that's a wall of text
+FIELDS_PER_EMBED = 10
+
+
+class ReportEntry(NamedTuple):
+    kind: int
+
+    #: the field that represents this report in a digest
+    name: str
+    value: str
+
+    #: how the report is sent when it's the only one in a flush
+    content: Optional[str] = None
+    embed: Optional[discord.Embed] = None
+
+
+def _field(text: str, limit: int) -> str:
+    text = text or '\u200b'
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def render(entries: List[ReportEntry]) -> List[Dict[str, Any]]:
+    """Render buffered reports into the keyword arguments of messages to send."""
+    if not entries:
+        return []
+
+    if len(entries) == 1:
+        entry = entries[0]
+        return [{'content': entry.content, 'embed': entry.embed}]
+
+    messages = []
+    ordered = sorted(entries, key=lambda entry: entry.kind)
+
+    for kind, group in itertools.groupby(ordered, key=lambda entry: entry.kind):
+        group = list(group)
+
+        for start in range(0, len(group), FIELDS_PER_EMBED):
+            chunk = group[start:start + FIELDS_PER_EMBED]
+
+            embed = discord.Embed(
+                color=DIGEST_COLORS[kind](),
+                title=DIGEST_TITLES[kind].format(count=len(group)),
+            )
+            embed.timestamp = datetime.datetime.utcnow()
+
+            for entry in chunk:
+                embed.add_field(name=_field(entry.name, 256), value=_field(entry.value, 1024), inline=False)
+
+            if len(group) > FIELDS_PER_EMBED:
+                page, pages = start // FIELDS_PER_EMBED + 1, -(-len(group) // FIELDS_PER_EMBED)
+                embed.set_footer(text=f'Page {page}/{pages}')
+
+            messages.append({'embed': embed})
+
+    return messages
+
+
+class ReportBuffer:
+    """Buffers the reports that are sent to a broadcast channel.
+
+    ``on_idle`` is called with the buffer when a flush leaves it empty, with
+    nothing scheduled, so that it can be forgotten about.
+    """
+
+    def __init__(self, channel: discord.TextChannel, *, loop, max_entries: int = 20,
+                 on_idle: Callable[['ReportBuffer'], None] = None) -> None:
+        self.channel = channel
+        self.loop = loop
+        self.max_entries = max_entries
+        self.on_idle = on_idle
+        self.entries: List[ReportEntry] = []
+
+        self.deadline: Optional[float] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.lock = asyncio.Lock()
+
+    def add(self, entry: ReportEntry):
+        self.entries.append(entry)
+
+        if len(self.entries) >= self.max_entries:
+            self._schedule(0)
+        else:
+            self._schedule(DELAYS[entry.kind])
+
+    def _schedule(self, delay: float):
+        deadline = self.loop.time() + delay
+
+        # an earlier flush is already scheduled
+        if self.deadline is not None and self.deadline <= deadline:
+            return
+
+        if self.timer is not None:
+            self.timer.cancel()
+
+        self.deadline = deadline
+        self.timer = self.loop.call_at(deadline, self._flush_soon)
+
+    def _flush_soon(self):
+        self.loop.create_task(self.flush())
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.deadline = None
+
+    async def flush(self):
+        """Send everything in the buffer."""
+        self.cancel()
+        entries, self.entries = self.entries, []
+
+        async with self.lock:
+            for message in render(entries):
+                try:
+                    await self.channel.send(**message)
+                except discord.HTTPException:
+                    log.warning('failed to send %d report(s) to %d', len(entries), self.channel.id)
+                    break
+
+        # more reports could've been added while sending
+        if not self.entries and self.timer is None and self.on_idle is not None:
+            self.on_idle(self)
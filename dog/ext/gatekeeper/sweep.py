@@ -0,0 +1,130 @@
+"""Retroactive Gatekeeper sweeps over the members of a guild.
+
+Members are checked in chunks, yielding to the event loop between chunks
+so that large guilds don't stall the bot. Members that fail a check are
+put on a bounded queue, which a few workers drain by kicking them; when
+the queue is full, checking waits for the kicks to catch up.
+
+If a check turns out to be misconfigured, the sweep is aborted: a broken
+check would otherwise mark everyone as failing it, and kick them all.
+"""
+
+__all__ = ['Sweep']
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+import discord
+
+log = logging.getLogger(__name__)
+
+
+class Sweep:
+    def __init__(self, keeper, members: Sequence[discord.Member], *, dry_run: bool = False,
+                 skip: Callable[[discord.Member], bool] = None, chunk_size: int = 500, concurrency: int = 3,
+                 queue_size: int = 50) -> None:
+        self.keeper = keeper
+        self.members = members
+        self.dry_run = dry_run
+        self.skip = skip
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+
+        self.checked = 0
+        self.skipped = 0
+        self.kicked = 0
+        self.failed = 0
+
+        #: members that failed a check, and why
+        self.blocked: List[Tuple[discord.Member, str]] = []
+
+        #: problems with the configuration
+        self.problems = set()
+
+        #: whether the sweep was stopped because of a problem
+        self.aborted = False
+
+    @property
+    def total(self) -> int:
+        return len(self.members)
+
+    def describe(self) -> str:
+        text = f'Checked {self.checked:,}/{self.total:,} member(s). {len(self.blocked):,} failed a check'
+
+        if self.aborted:
+            text = 'Aborted because of a problem with the configuration. ' + text
+            if self.dry_run:
+                return text + '.'
+            return text + f', {self.kicked:,} kicked before stopping.'
+
+        if self.dry_run:
+            return text + ' (dry run, nobody was kicked).'
+
+        return text + f', {self.kicked:,} kicked, {self.failed:,} could not be kicked.'
+
+    async def _kick(self, queue: asyncio.Queue):
+        while True:
+            member, reason = await queue.get()
+
+            try:
+                error = await self.keeper.kick(member, reason)
+            except Exception:
+                log.exception('failed to kick %d during a sweep', member.id)
+                error = True
+            finally:
+                queue.task_done()
+
+            if error is None:
+                self.kicked += 1
+            else:
+                self.failed += 1
+
+    async def run(self, progress: Callable[['Sweep'], Awaitable[None]] = None, *, progress_interval: float = 3.0):
+        """Run the sweep, calling ``progress`` every so often."""
+        queue: Optional[asyncio.Queue] = None
+        workers = []
+
+        if not self.dry_run:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            workers = [asyncio.ensure_future(self._kick(queue)) for _ in range(self.concurrency)]
+
+        last_progress = time.monotonic()
+
+        try:
+            for start in range(0, self.total, self.chunk_size):
+                for member in self.members[start:start + self.chunk_size]:
+                    self.checked += 1
+
+                    if self.skip is not None and self.skip(member):
+                        self.skipped += 1
+                        continue
+
+                    reason, problem = await self.keeper.evaluate(member)
+                    if problem is not None:
+                        self.problems.add(problem)
+                        self.aborted = True
+                        return
+                    if reason is None:
+                        continue
+
+                    self.blocked.append((member, reason))
+                    if queue is not None:
+                        # waits when the kicks can't keep up
+                        await queue.put((member, reason))
+
+                # let everything else run between chunks
+                await asyncio.sleep(0)
+
+                if progress is not None and time.monotonic() - last_progress >= progress_interval:
+                    last_progress = time.monotonic()
+                    await progress(self)
+
+            if queue is not None:
+                await queue.join()
+        finally:
+            # when aborting, kicks that are still queued are dropped
+            for worker in workers:
+                worker.cancel()
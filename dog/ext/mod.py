@@ -1,11 +1,128 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
 import discord
 from discord.ext.commands import bot_has_permissions, guild_only, has_permissions
 from lifesaver.bot import Cog, Context, command
 from lifesaver.utils import clean_mentions, escape_backticks
 from lifesaver.utils.timing import Ratelimiter
 
+from dog.aho_corasick import AhoCorasick
 from dog.converters import SoftMember
 from dog.formatting import represent
+from dog.guild_config import GuildConfig, config_compiler
+from dog.pipeline import MessageFacts, message_stage
+from dog.safe_regex import MAX_SUBJECT_LENGTH, UnsafePattern, compile_guarded
+
+log = logging.getLogger(__name__)
+
+
+class Autoresponses:
+    """A guild's autoresponses, compiled for matching.
+
+    Plain triggers are matched anywhere in a message with an Aho–Corasick
+    automaton. Triggers that are configured as a mapping can instead be a
+    regex (``regex: true``) or only match whole words (``word: true``).
+    Those are merged into one alternation inside of a lookahead, which finds
+    every position that some trigger matches at; at each of those, the
+    triggers are tried again in configuration order. When several triggers
+    match, the one that comes first in the configuration wins, like it did
+    when every trigger was checked in turn.
+
+    Regex triggers are guarded like custom shortlinks (see
+    :mod:`dog.safe_regex`), and only see the start of long messages.
+    """
+
+    def __init__(self, autoresponses: Dict[Any, Any]) -> None:
+        self.responses: List[str] = []
+        plain: List[str] = []
+        self.plain_indexes: List[int] = []
+
+        #: (index, pattern) of the regex and word triggers, in configuration order
+        self.regexes: List[Tuple[int, Pattern]] = []
+
+        for trigger, response in autoresponses.items():
+            trigger = str(trigger)
+            is_regex = is_word = False
+
+            if isinstance(response, dict):
+                is_regex = bool(response.get('regex', False))
+                is_word = bool(response.get('word', False))
+                response = response.get('response')
+
+            if not isinstance(response, str) or not response:
+                continue
+
+            index = len(self.responses)
+
+            if is_regex:
+                try:
+                    self.regexes.append((index, compile_guarded(trigger)))
+                except UnsafePattern as error:
+                    log.info('skipping autoresponse regex %r: %s', trigger, error)
+                    continue
+            elif is_word:
+                # not \b, so that triggers can start or end with punctuation
+                self.regexes.append((index, re.compile(rf'(?<!\w){re.escape(trigger)}(?!\w)')))
+            else:
+                plain.append(trigger)
+                self.plain_indexes.append(index)
+
+            self.responses.append(response)
+
+        self.automaton = AhoCorasick(plain) if plain else None
+        self.combined: Optional[Pattern] = None
+
+        if self.regexes:
+            try:
+                self.combined = re.compile(
+                    '(?=' + '|'.join(f'(?:{pattern.pattern})' for _, pattern in self.regexes) + ')'
+                )
+            except re.error:
+                # regexes with clashing group names or inline flags can't be
+                # combined, so they're searched for one by one
+                pass
+
+    def _first_regex(self, subject: str, below: Optional[int]) -> Optional[int]:
+        candidates = [(index, pattern) for index, pattern in self.regexes if below is None or index < below]
+        if not candidates:
+            return None
+
+        if self.combined is None:
+            return next((index for index, pattern in candidates if pattern.search(subject)), None)
+
+        best = None
+
+        for hit in self.combined.finditer(subject):
+            position = hit.start()
+
+            for index, pattern in candidates:
+                if best is not None and index >= best:
+                    break
+                if pattern.match(subject, position):
+                    best = index
+                    break
+
+            if best == candidates[0][0]:
+                break
+
+        return best
+
+    def match(self, content: str) -> Optional[str]:
+        """Return the response to a message, if any."""
+        best = None
+
+        if self.automaton is not None:
+            found = self.automaton.first_match(content)
+            if found is not None:
+                best = self.plain_indexes[found]
+
+        found = self._first_regex(content[:MAX_SUBJECT_LENGTH], best)
+        if found is not None:
+            best = found
+
+        return None if best is None else self.responses[best]
 
 
 class Mod(Cog):
@@ -29,24 +146,29 @@ class Mod(Cog):
         else:
             await ctx.send(f'\N{OK HAND SIGN} Banned {represent(target)}.')
 
-    async def on_message(self, message):
-        if not message.guild or message.author.bot:
+    @config_compiler('autoresponses')
+    def compile_autoresponses(self, autoresponses, _config: GuildConfig) -> Optional[Autoresponses]:
+        if not isinstance(autoresponses, dict) or not autoresponses:
+            return None
+        return Autoresponses(autoresponses)
+
+    @message_stage(guild_only=True, ignore_bots=True)
+    async def autorespond(self, message: discord.Message, facts: MessageFacts):
+        autoresponses = self.bot.guild_configs.artifact(facts.guild, 'autoresponses')
+        if autoresponses is None:
             return
 
-        config = self.bot.guild_configs.get(message.guild)
-        if not config:
+        response = autoresponses.match(message.content)
+        if response is None:
             return
-        autoresponses = config.get('autoresponses', {})
 
-        for trigger, response in autoresponses.items():
-            if trigger in message.content:
-                if self.auto_cooldown.is_rate_limited(message.author.id, message.channel.id):
-                    return
-                cleaned_response = clean_mentions(message.channel, response)
-                try:
-                    await message.channel.send(cleaned_response)
-                except discord.HTTPException:
-                    pass
+        if self.auto_cooldown.is_rate_limited(message.author.id, message.channel.id):
+            return
+        cleaned_response = clean_mentions(message.channel, response)
+        try:
+            await message.channel.send(cleaned_response)
+        except discord.HTTPException:
+            pass
 
     @command()
     @guild_only()
@@ -5,9 +5,9 @@ from random import choice
 import discord
 from discord.ext import commands
 from lifesaver.bot import Cog, command, group
-from lifesaver.bot.storage import AsyncJSONStorage
 from lifesaver.utils import ListPaginator, human_delta, pluralize, truncate, clean_mentions
 
+from dog.storage import AsyncLogStorage
 from .converters import Messages, QuoteName
 from .utils import stringify_message
 
@@ -30,7 +30,7 @@ def embed_quote(quote) -> discord.Embed:
 class Quoting(Cog):
     def __init__(self, bot, *args, **kwargs):
         super().__init__(bot, *args, **kwargs)
-        self.storage = AsyncJSONStorage('quotes.json', loop=bot.loop)
+        self.storage = AsyncLogStorage('quotes.json', loop=bot.loop)
 
     def quotes(self, guild: discord.Guild):
         return self.storage.get(str(guild.id), {})
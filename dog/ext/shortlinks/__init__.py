@@ -0,0 +1,5 @@
+from .cog import Shortlinks
+
+
+def setup(bot):
+    bot.add_cog(Shortlinks(bot))
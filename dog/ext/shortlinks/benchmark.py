@@ -0,0 +1,113 @@
+"""Benchmarks the shortlink scanner against the loop that it replaced.
+
+A synthetic corpus of chat messages (mostly ordinary chatter, some with
+shortlinks, stop words, or near misses like plain mentions) is run through
+both implementations, and their results are compared.
+
+Run it offline with ``python -m dog.ext.shortlinks.benchmark``.
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, Iterable, List, Set
+
+from .definitions import SHORTLINKS, STOP_WORDS
+from .scanner import scanner_for
+
+__all__ = ['legacy_expand', 'corpus', 'measure', 'report']
+
+WORDS = (
+    'the', 'a', 'lol', 'dog', 'bot', 'what', 'is', 'this', 'python', 'server', 'okay', 'yeah', 'when',
+    'does', 'it', 'work', 'nice', 'thanks', 'anyone', 'here', 'know', 'how', 'to', 'fix', 'that',
+)
+
+SPECIMENS = (
+    '@{word}@mastodon.social',
+    'PEP#{number}',
+    'kb/{word}',
+    'osu/{word}',
+    'osu/kb/{word}',
+    '<@{number}>',
+    'email me at {word}@example',
+    'see https://{word}.com/',
+)
+
+
+def legacy_expand(content: str, whitelist: Iterable[str] = (), blacklist: Iterable[str] = ()) -> Set[str]:
+    """The way shortlinks were expanded before the scanner."""
+    if any(text in content for text in STOP_WORDS):
+        return set()
+
+    expanded = set()
+    for (name, shortlink) in SHORTLINKS.items():
+        if (whitelist and (name not in whitelist)) or (name in blacklist):
+            continue
+        expanded |= set(shortlink.execute(content))
+
+    return expanded
+
+
+def corpus(size: int, *, seed: int = None, specimen_rate: float = 0.05, stop_rate: float = 0.005) -> List[str]:
+    """Generate a corpus of chat messages."""
+    rng = random.Random(seed)
+    messages = []
+
+    for _ in range(size):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 20))]
+
+        if rng.random() < specimen_rate:
+            specimen = rng.choice(SPECIMENS).format(word=rng.choice(WORDS), number=rng.randint(1, 9999))
+            words.insert(rng.randint(0, len(words)), specimen)
+
+        if rng.random() < stop_rate:
+            words.append(rng.choice(sorted(STOP_WORDS)))
+
+        messages.append(' '.join(words))
+
+    return messages
+
+
+def measure(expand: Callable[[str], Iterable[str]], messages: List[str], *, repeat: int = 3) -> float:
+    """Return the best throughput of an implementation, in messages per second."""
+    best = float('inf')
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for message in messages:
+            expand(message)
+        best = min(best, time.perf_counter() - started)
+
+    return len(messages) / best
+
+
+def report(size: int, *, seed: int = None, repeat: int = 3) -> List[str]:
+    messages = corpus(size, seed=seed)
+    scanner = scanner_for()
+
+    mismatches = sum(1 for message in messages if set(scanner.scan(message)) != legacy_expand(message))
+    expanding = sum(1 for message in messages if scanner.scan(message))
+
+    legacy = measure(legacy_expand, messages, repeat=repeat)
+    scanned = measure(scanner.scan, messages, repeat=repeat)
+
+    return [
+        f'corpus: {size:,} messages ({expanding:,} with shortlinks)',
+        f'legacy: {legacy:,.0f} messages/sec',
+        f'scanner: {scanned:,.0f} messages/sec ({scanned / legacy:.2f}x)',
+        f'mismatches: {mismatches:,}',
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the shortlink scanner.')
+    parser.add_argument('--messages', type=int, default=100_000, help='messages in the corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per implementation (the best is used)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    print('\n'.join(report(args.messages, seed=args.seed, repeat=args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+from typing import Optional
+
+import discord
+
+from lifesaver.bot import Cog
+from lifesaver.utils import clean_mentions
+
+from dog.guild_config import GuildConfig, config_compiler
+from dog.pipeline import MessageFacts, message_stage
+
+from .custom import compile_custom
+from .scanner import Scanner, scanner_for
+
+
+class Shortlinks(Cog):
+    def __init__(self, bot, *args, **kwargs):
+        super().__init__(bot, *args, **kwargs)
+
+    @config_compiler('shortlinks')
+    def compile_shortlinks(self, shortlinks_config, config: GuildConfig) -> Optional[Scanner]:
+        if not isinstance(shortlinks_config, dict) or not shortlinks_config.get('enabled', False):
+            return None
+        custom = compile_custom(shortlinks_config.get('custom'))
+        return scanner_for(config.shortlinks_whitelist, config.shortlinks_blacklist, custom)
+
+    @message_stage(guild_only=True, ignore_bots=True)
+    async def expand_shortlinks(self, msg: discord.Message, facts: MessageFacts):
+        scanner = self.bot.guild_configs.artifact(facts.guild, 'shortlinks')
+        if scanner is None:
+            return
+
+        expanded = scanner.scan(msg.content)
+        if not expanded:
+            return
+
+        try:
+            # custom shortlinks can put anything from the message in their URL
+            await msg.channel.send(clean_mentions(msg.channel, '\n'.join(expanded)))
+        except discord.HTTPException:
+            pass
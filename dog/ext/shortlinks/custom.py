@@ -0,0 +1,130 @@
+"""Shortlinks that are defined by guilds in their configuration.
+
+Custom shortlinks are configured in the ``shortlinks`` section::
+
+    shortlinks:
+        enabled: true
+        custom:
+            issue:
+                pattern: 'gh#(?P<number__int>\\d+)'
+                url: 'https://github.com/example/example/issues/{number}'
+
+Group names can end in ``__int`` or ``__float`` to be converted, like the
+built-in shortlinks. Because these patterns run on every message, they are
+guarded against patterns that can backtrack catastrophically (see
+:mod:`dog.safe_regex`), and only see the start of long messages.
+"""
+
+import logging
+import re
+import string
+from typing import Any, List, Optional, Pattern, Tuple
+
+from dog.safe_regex import UnsafePattern, compile_guarded, sre_parse
+
+from .definitions import SHORTLINKS, Shortlink
+from .scanner import _anonymize
+
+__all__ = ['InvalidShortlink', 'MAX_CUSTOM_SHORTLINKS', 'check_pattern', 'check_template', 'compile_custom']
+
+log = logging.getLogger(__name__)
+
+#: the maximum amount of custom shortlinks that a guild can have
+MAX_CUSTOM_SHORTLINKS = 10
+
+#: the maximum width or precision in a URL template's format spec
+MAX_FORMAT_WIDTH = 64
+
+
+class InvalidShortlink(Exception):
+    """Raised when a custom shortlink is invalid."""
+
+
+def _literal_prefix(pattern) -> Optional[str]:
+    prefix = ''
+
+    for op, argument in pattern:
+        if str(op) != 'LITERAL':
+            break
+        prefix += chr(argument)
+
+    return prefix or None
+
+
+def check_pattern(pattern: Any) -> Tuple[Pattern, Optional[str]]:
+    """Check and compile a custom shortlink pattern.
+
+    Returns the compiled pattern and a probe (the literal text that the
+    pattern starts with, if any).
+    """
+    try:
+        compiled = compile_guarded(pattern)
+    except UnsafePattern as error:
+        raise InvalidShortlink(str(error))
+
+    try:
+        # it has to still compile once its named groups are made anonymous,
+        # to be combined with other shortlinks
+        re.compile(_anonymize(pattern))
+    except re.error as error:
+        raise InvalidShortlink(f'The pattern can not be combined with other shortlinks: {error}')
+
+    for group in compiled.groupindex:
+        if '__' in group and group.split('__', 1)[1] not in Shortlink.CONVERTERS:
+            raise InvalidShortlink(f'Unknown converter in group {group!r}.')
+
+    # a case insensitive pattern can't be probed for with a substring
+    probe = None if compiled.flags & re.IGNORECASE else _literal_prefix(sre_parse.parse(pattern))
+    return compiled, probe
+
+
+def check_template(template: Any, pattern: Pattern):
+    """Check that a URL template only refers to the groups of its pattern."""
+    if not isinstance(template, str) or not template.startswith(('https://', 'http://')):
+        raise InvalidShortlink('The URL must be text that starts with https:// or http://.')
+
+    groups = {group.split('__', 1)[0] for group in pattern.groupindex}
+
+    try:
+        fields = list(string.Formatter().parse(template))
+    except ValueError as error:
+        raise InvalidShortlink(f'The URL is invalid: {error}')
+
+    for _, field, spec, conversion in fields:
+        if field is None:
+            continue
+        if field not in groups:
+            raise InvalidShortlink(f'The URL refers to {field!r}, which is not a named group of the pattern.')
+        if conversion is not None or '{' in spec:
+            raise InvalidShortlink('Conversions and nested fields are not allowed in the URL.')
+        if any(int(number) > MAX_FORMAT_WIDTH for number in re.findall(r'\d+', spec)):
+            raise InvalidShortlink(f'Format widths larger than {MAX_FORMAT_WIDTH} are not allowed.')
+
+
+def compile_custom(definitions: Any) -> List[Tuple[str, Shortlink]]:
+    """Compile a guild's custom shortlinks, skipping (and logging) invalid ones."""
+    if not isinstance(definitions, dict):
+        return []
+
+    shortlinks = []
+
+    for name, definition in definitions.items():
+        name = str(name)
+
+        try:
+            if len(shortlinks) >= MAX_CUSTOM_SHORTLINKS:
+                raise InvalidShortlink(f'Only {MAX_CUSTOM_SHORTLINKS} custom shortlinks are allowed.')
+            if name in SHORTLINKS:
+                raise InvalidShortlink('The name is taken by a built-in shortlink.')
+            if not isinstance(definition, dict):
+                raise InvalidShortlink('The definition must have a pattern and a URL.')
+
+            pattern, probe = check_pattern(definition.get('pattern'))
+            check_template(definition.get('url'), pattern)
+        except InvalidShortlink as error:
+            log.info('skipping custom shortlink %r: %s', name, error)
+            continue
+
+        shortlinks.append((name, Shortlink(pattern, definition['url'], call_format=True, probe=probe)))
+
+    return shortlinks
@@ -1,8 +1,7 @@
 import re
+from typing import Optional
 
-import discord
-
-from lifesaver.bot import Cog
+__all__ = ['STOP_WORDS', 'STOP_WORD_PROBE', 'Shortlink', 'SHORTLINKS']
 
 STOP_WORDS = {
     '[no-link]',
@@ -16,6 +15,9 @@ STOP_WORDS = {
     '[noshortlinks]',
 }
 
+#: a substring that every stop word contains
+STOP_WORD_PROBE = '[no'
+
 
 class Shortlink:
     CONVERTERS = {
@@ -23,11 +25,15 @@ class Shortlink:
         'float': float,
     }
 
-    def __init__(self, pattern, fmt, *, call_format: bool = False):
+    def __init__(self, pattern, fmt, *, call_format: bool = False, probe: Optional[str] = None):
         self.pattern = re.compile(pattern)
         self.format = fmt
         self.call_format = call_format
 
+        #: a substring that every match contains, used to skip messages
+        #: that can't possibly match
+        self.probe = probe
+
     def convert_groups(self, dct):
         converted = {}
         for name, value in dct.items():
@@ -59,58 +65,25 @@ SHORTLINKS = {
     "mastodon": Shortlink(
         r'@(?P<username>\w+)@(?P<instance>\w{2,}\.[a-z]{2,10})',
         'https://\\g<instance>/@\\g<username>',
+        probe='@',
     ),
 
     "pep": Shortlink(
         r'PEP#(?P<pep__int>\d{1,4})',
         'https://www.python.org/dev/peps/pep-{pep:04}',
         call_format=True,
+        probe='PEP#',
     ),
 
     "keybase": Shortlink(
         r'kb/(?P<username>\w+)',
         'https://keybase.io/\\g<username>',
+        probe='kb/',
     ),
 
     "osu": Shortlink(
         r'osu/(?P<username>\w+)',
         'https://osu.ppy.sh/users/\\g<username>',
+        probe='osu/',
     ),
 }
-
-
-class Shortlinks(Cog):
-    def __init__(self, bot, *args, **kwargs):
-        super().__init__(bot, *args, **kwargs)
-
-    async def on_message(self, msg):
-        if not msg.guild or msg.author.bot:
-            return
-
-        config = self.bot.guild_configs.get(msg.guild) or {}
-        shortlinks_config = config.get('shortlinks', {})
-        if not shortlinks_config.get('enabled', False):
-            return
-        whitelist = shortlinks_config.get('whitelist', [])
-        blacklist = shortlinks_config.get('blacklist', [])
-
-        if any(text in msg.content for text in STOP_WORDS):
-            return
-
-        expanded = set()
-        for (name, shortlink) in SHORTLINKS.items():
-            if (whitelist and (name not in whitelist)) or (name in blacklist):
-                continue
-            expanded |= set(shortlink.execute(msg.content))
-
-        if not expanded:
-            return
-
-        try:
-            await msg.channel.send('\n'.join(expanded))
-        except discord.HTTPException:
-            pass
-
-
-def setup(bot):
-    bot.add_cog(Shortlinks(bot))
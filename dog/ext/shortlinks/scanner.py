@@ -0,0 +1,114 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dog.safe_regex import MAX_SUBJECT_LENGTH
+
+from .definitions import SHORTLINKS, STOP_WORDS, STOP_WORD_PROBE, Shortlink
+
+__all__ = ['Scanner', 'scanner_for']
+
+# matches the opening of a named group, so that the group can be made
+# anonymous (named groups would clash once the patterns are combined)
+NAMED_GROUP = re.compile(r'(?<!\\)\(\?P<\w+>')
+
+
+def _anonymize(pattern: str) -> str:
+    return NAMED_GROUP.sub('(?:', pattern)
+
+
+class Scanner:
+    """Expands a set of shortlinks in a single pass over a message.
+
+    The patterns of the shortlinks are merged into one alternation inside
+    of a lookahead, which finds every position that some shortlink matches
+    at without consuming anything. At each of those positions, the
+    shortlinks are matched again with their own patterns. A shortlink is
+    only matched past the end of its previous match, so the results are
+    the same as running every pattern's ``finditer`` separately, even when
+    matches of different shortlinks overlap (like ``osu/kb/foo``).
+
+    Messages that don't contain the probe substring of any shortlink are
+    rejected without running any regex at all. If ``max_length`` is given,
+    only that much of a message is scanned.
+    """
+
+    def __init__(self, shortlinks: Iterable[Tuple[str, Shortlink]], *, max_length: int = None) -> None:
+        self.shortlinks: List[Tuple[str, Shortlink]] = list(shortlinks)
+        self.max_length = max_length
+
+        #: if any shortlink has no probe, every message has to be scanned
+        probes = [shortlink.probe for _, shortlink in self.shortlinks]
+        self.probes: Optional[Tuple[str, ...]] = None if None in probes else tuple(set(probes))
+
+        self.pattern = re.compile('(?=' + '|'.join(
+            f'(?:{_anonymize(shortlink.pattern.pattern)})' for _, shortlink in self.shortlinks
+        ) + ')') if self.shortlinks else None
+
+    def scan(self, text: str) -> List[str]:
+        """Return the expanded shortlinks in a message, without duplicates."""
+        if self.pattern is None:
+            return []
+
+        if self.max_length is not None:
+            text = text[:self.max_length]
+
+        if self.probes is not None and not any(probe in text for probe in self.probes):
+            return []
+
+        if STOP_WORD_PROBE in text and any(word in text for word in STOP_WORDS):
+            return []
+
+        expanded = {}
+
+        #: where each shortlink can match next
+        resume = [0] * len(self.shortlinks)
+
+        for hit in self.pattern.finditer(text):
+            position = hit.start()
+
+            for index, (_, shortlink) in enumerate(self.shortlinks):
+                if position < resume[index]:
+                    continue
+
+                match = shortlink.pattern.match(text, position)
+                if match is None:
+                    continue
+
+                resume[index] = max(match.end(), position + 1)
+
+                try:
+                    expanded[shortlink.expand_match(match)] = None
+                except (TypeError, ValueError):
+                    # a converted group didn't participate in the match, or
+                    # couldn't be converted
+                    continue
+
+        return list(expanded)
+
+
+#: enabled shortlink names -> scanner, as most guilds enable the same ones
+_scanners: Dict[Tuple[str, ...], Scanner] = {}
+
+
+def scanner_for(whitelist: Iterable[str] = (), blacklist: Iterable[str] = (),
+                custom: Iterable[Tuple[str, Shortlink]] = ()) -> Scanner:
+    """Return a scanner for the shortlinks that pass a whitelist and blacklist.
+
+    Scanners of only built-in shortlinks are shared. Scanners with custom
+    shortlinks only scan the start of long messages.
+    """
+    whitelist, blacklist = set(whitelist), set(blacklist)
+
+    def enabled(name):
+        return not ((whitelist and name not in whitelist) or name in blacklist)
+
+    names = tuple(name for name in SHORTLINKS if enabled(name))
+    custom = [(name, shortlink) for name, shortlink in custom if enabled(name)]
+
+    if custom:
+        return Scanner([(name, SHORTLINKS[name]) for name in names] + custom, max_length=MAX_SUBJECT_LENGTH)
+
+    scanner = _scanners.get(names)
+    if scanner is None:
+        scanner = _scanners[names] = Scanner((name, SHORTLINKS[name]) for name in names)
+    return scanner
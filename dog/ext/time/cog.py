@@ -7,12 +7,12 @@ import pytz
 from discord.ext import commands
 from discord.ext.commands import BucketType, cooldown
 from lifesaver.bot import Cog, command, group
-from lifesaver.bot.storage import AsyncJSONStorage
 from lifesaver.utils import clean_mentions
 from lifesaver.utils.timing import Timer
 from geopy import exc as geopy_errors
 
 from dog.context import Context
+from dog.storage import AsyncLogStorage
 from .converters import hour_minute, Timezone
 from .geocoder import Geocoder
 from .map import Map
@@ -27,7 +27,7 @@ class Time(Cog):
     def __init__(self, bot):
         super().__init__(bot)
         self.geocoder = Geocoder(bot=bot, loop=bot.loop)
-        self.timezones = AsyncJSONStorage('timezones.json', loop=bot.loop)
+        self.timezones = AsyncLogStorage('timezones.json', loop=bot.loop)
 
     def get_timezone_for(self, user: discord.User, *, raw: bool = False):
         timezone = self.timezones.get(user.id)
@@ -11,6 +11,7 @@ from lifesaver.bot import Cog, Context, command
 from lifesaver.utils import history_reducer
 
 from dog.converters import EmojiStealer, UserIDs
+from dog.pipeline import MessageFacts, message_stage
 
 EMOJI_NAME_REGEX = re.compile(r'<a?(:.+:)\d+>')
 
@@ -20,12 +21,9 @@ class Utility(Cog):
         super().__init__(bot)
         self.gateway_lag = defaultdict(list)
 
-    async def on_message(self, message: discord.Message):
-        if not message.guild:
-            return
-
-        config = self.bot.guild_configs.get(message.guild)
-        if not config or not config.get('measure_gateway_lag', False):
+    @message_stage(guild_only=True)
+    async def measure_gateway_lag(self, message: discord.Message, facts: MessageFacts):
+        if not facts.config.get('measure_gateway_lag', False):
             return
 
         # calculate gateway lag
@@ -1,18 +1,232 @@
+import copy
+import inspect
+import io
+import itertools
 import logging
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import discord
-from lifesaver.bot.storage import AsyncJSONStorage
 from ruamel.yaml import YAML, YAMLError
 
+from dog.storage import AsyncLogStorage
+
 log = logging.getLogger(__name__)
 
+#: a path into a configuration, such as ``['gatekeeper', 'checks', 'block_all']``
+Path = Sequence[Union[str, int]]
+
+#: operations that can be used to patch a configuration (named after JSON Patch's)
+OPERATIONS = {'add', 'replace', 'remove', 'test'}
+
+
+class ConfigPathError(Exception):
+    """Raised when a configuration can't be patched at some path."""
+
+
+def config_compiler(section: str):
+    """Register a cog method as the compiler of a configuration section.
+
+    The method is called with the section (or None if it is missing) and the
+    :class:`GuildConfig` it came from, and returns an artifact that is cached
+    until the guild's configuration changes. Fetch the artifact with
+    :meth:`GuildConfigManager.artifact`.
+    """
+    def decorator(func):
+        func.__config_section__ = section
+        return func
+
+    return decorator
+
+
+def _identities(value) -> Tuple[FrozenSet[int], FrozenSet[str]]:
+    """Split a list of ids and user#discrim tags (or a single one) into sets."""
+    if not isinstance(value, list):
+        value = [] if value is None else [value]
+
+    ids = frozenset(item for item in value if isinstance(item, int) and not isinstance(item, bool))
+    tags = frozenset(item for item in value if isinstance(item, str))
+    return ids, tags
+
+
+def _names(value) -> FrozenSet[str]:
+    if not isinstance(value, list):
+        return frozenset()
+    return frozenset(str(item) for item in value)
+
+
+def _section(data: Dict[str, Any], name: str) -> Dict[str, Any]:
+    section = data.get(name)
+    return section if isinstance(section, dict) else {}
+
+
+def _format_path(path: Path) -> str:
+    return '/' + '/'.join(str(token) for token in path)
+
+
+def _key(container: dict, token):
+    # keys like role ids are integers in YAML, but strings in paths
+    if token not in container and isinstance(token, str) and token.isdigit() and int(token) in container:
+        return int(token)
+    return token
+
+
+def _index(container: list, token, path: Path, *, insert: bool = False) -> int:
+    if insert and token == '-':
+        return len(container)
+
+    try:
+        index = int(token)
+    except (TypeError, ValueError):
+        raise ConfigPathError(f'{_format_path(path)}: {token!r} is not a list index')
+
+    if not 0 <= index < len(container) + insert:
+        raise ConfigPathError(f'{_format_path(path)}: list index {index} is out of range')
+
+    return index
+
+
+def _child(container, token, path: Path) -> Tuple[Any, Any]:
+    """Return the resolved key of a child of a container, and the child."""
+    if isinstance(container, dict):
+        key = _key(container, token)
+        if key not in container:
+            raise ConfigPathError(f'{_format_path(path)}: {token!r} does not exist')
+        return key, container[key]
+    elif isinstance(container, list):
+        index = _index(container, token, path)
+        return index, container[index]
+
+    raise ConfigPathError(f'{_format_path(path)}: {token!r} is not inside of a mapping or list')
+
+
+def _copy_path(root, path: Path):
+    """Shallowly copy every container along a path, so it can be changed without mutating ``root``."""
+    root = node = copy.copy(root)
+
+    for token in path[:-1]:
+        key, child = _child(node, token, path)
+        node[key] = node = copy.copy(child)
+
+    return root
+
+
+def _apply(root, op: str, path: Path, value=None):
+    """Apply an operation to a configuration in place, returning the new root."""
+    if op not in OPERATIONS:
+        raise ConfigPathError(f'Unknown operation: {op!r}')
+
+    if not path:
+        if op == 'test':
+            if root != value:
+                raise ConfigPathError('/: test failed')
+            return root
+        elif op == 'remove' or not isinstance(value, dict):
+            raise ConfigPathError('/: the configuration must be a mapping')
+        return value
+
+    parent = root
+    for token in path[:-1]:
+        _, parent = _child(parent, token, path)
+
+    last = path[-1]
+
+    if isinstance(parent, list) and op == 'add':
+        parent.insert(_index(parent, last, path, insert=True), value)
+        return root
+
+    if isinstance(parent, dict) and op == 'add':
+        parent[_key(parent, last)] = value
+        return root
+
+    key, current = _child(parent, last, path)
+
+    if op == 'remove':
+        del parent[key]
+    elif op == 'replace':
+        parent[key] = value
+    elif current != value:
+        raise ConfigPathError(f'{_format_path(path)}: test failed')
+
+    return root
+
+
+class GuildConfig(NamedTuple):
+    """A compiled guild configuration.
+
+    Compiled configurations are immutable, and are recompiled (with a new
+    version) whenever the guild's configuration is written. The values that
+    are checked on hot paths are precomputed into sets.
+    """
+
+    guild_id: int
+    version: int
+
+    #: the configuration as YAML, as it was written
+    text: str
+
+    #: the parsed configuration; do not mutate this
+    data: Dict[str, Any]
+
+    disabled_cogs: FrozenSet[str]
+    editor_ids: FrozenSet[int]
+    editor_tags: FrozenSet[str]
+    shortlinks_whitelist: FrozenSet[str]
+    shortlinks_blacklist: FrozenSet[str]
+    gatekeeper_allowed_ids: FrozenSet[int]
+    gatekeeper_allowed_tags: FrozenSet[str]
+
+    @classmethod
+    def compile(cls, guild_id: int, version: int, text: str, data: Dict[str, Any]) -> 'GuildConfig':
+        editor_ids, editor_tags = _identities(data.get('editors'))
+        shortlinks = _section(data, 'shortlinks')
+        allowed_ids, allowed_tags = _identities(_section(data, 'gatekeeper').get('allowed_users'))
+
+        return cls(
+            guild_id=guild_id,
+            version=version,
+            text=text,
+            data=data,
+            disabled_cogs=_names(data.get('disabled_cogs')),
+            editor_ids=editor_ids,
+            editor_tags=editor_tags,
+            shortlinks_whitelist=_names(shortlinks.get('whitelist')),
+            shortlinks_blacklist=_names(shortlinks.get('blacklist')),
+            gatekeeper_allowed_ids=allowed_ids,
+            gatekeeper_allowed_tags=allowed_tags,
+        )
+
+    def is_editor(self, user: discord.User, member: Optional[discord.Member] = None) -> bool:
+        # user#discrim, user id, role id
+        return (user.id in self.editor_ids
+                or str(user) in self.editor_tags
+                or (member is not None and any(role.id in self.editor_ids for role in member.roles)))
+
+    def is_gatekeeper_allowed(self, user: discord.User) -> bool:
+        return user.id in self.gatekeeper_allowed_ids or str(user) in self.gatekeeper_allowed_tags
+
 
 class GuildConfigManager:
     def __init__(self, bot):
         self.bot = bot
-        self.yaml = YAML()
-        self.persistent = AsyncJSONStorage('guild_configs.json', loop=bot.loop)
-        self.parsed_cache = {}
+        self.yaml = YAML(typ='safe')
+
+        # used when patching, so that comments and formatting are kept
+        self.round_trip = YAML()
+        self.round_trip.indent(mapping=4, sequence=6, offset=4)
+        self.persistent = AsyncLogStorage('guild_configs.json', loop=bot.loop)
+
+        #: guild id -> compiled configuration (None if the configuration is invalid)
+        self.compiled: Dict[int, Optional[GuildConfig]] = {}
+        self._versions = itertools.count(1)
+
+        #: section name -> compiler
+        self.compilers: Dict[str, Callable[[Any, GuildConfig], Any]] = {}
+
+        #: (guild id, section name) -> (config version, artifact)
+        self.artifacts: Dict[Tuple[int, str], Tuple[int, Any]] = {}
+
+        #: guild id -> (config version, round-trip document), for patching
+        self.documents: Dict[int, Tuple[int, Any]] = {}
 
     def _id(self, obj) -> str:
         """Resolves an object into a key for guild_configs.json."""
@@ -31,7 +245,7 @@ class GuildConfigManager:
         if guild.owner == user:
             return True
 
-        config = self.get(guild)
+        config = self.get_compiled(guild)
 
         # special exception:
         #
@@ -47,41 +261,155 @@ class GuildConfigManager:
         if config is None:
             return False
 
-        editors = config.get('editors', [])
-        if isinstance(editors, list):  # list of ids
-            # user#discrim, user id, role id
-            if (str(user) in editors
-                    or user.id in editors
-                    or (member is not None and any(role.id in editors for role in member.roles))):
-                return True
-        elif isinstance(editors, int):  # a single id
-            return user.id == editors
-        else:
-            return False
+        return config.is_editor(user, member)
+
+    def _compile(self, guild_id: int, text: str) -> Optional[GuildConfig]:
+        try:
+            data = self.yaml.load(text)
+        except YAMLError:
+            log.warning('Invalid YAML config (%d): %s', guild_id, text)
+            return None
+
+        if not isinstance(data, dict):
+            return None
+
+        return GuildConfig.compile(guild_id, next(self._versions), text, data)
+
+    def _store(self, guild_id: int, compiled: Optional[GuildConfig]):
+        self.compiled[guild_id] = compiled
+        self.documents.pop(guild_id, None)
+        self.bot.disabled_cog_masks.pop(guild_id, None)
+
+        # artifacts are recompiled lazily, the next time that they are needed
+        for section in self.compilers:
+            self.artifacts.pop((guild_id, section), None)
+
+        self.bot.dispatch('guild_config_write', guild_id)
 
     async def write(self, guild, config: str):
-        await self.persistent.put(self._id(guild), config)
+        key = self._id(guild)
+        self._store(int(key), self._compile(int(key), config))
+        await self.persistent.put(key, config)
+
+    def _document(self, guild_id: int, config: Optional[GuildConfig]):
+        cached = self.documents.get(guild_id)
+        if cached is not None and config is not None and cached[0] == config.version:
+            return cached[1]
 
-    def get(self, guild, *, yaml: bool = False):
-        config = self.persistent.get(self._id(guild))
         if config is None:
-            return None
+            return self.round_trip.map()
+        return self.round_trip.load(config.text)
 
-        if yaml:
-            # return the configuration as-is, without parsing
-            return config
+    async def patch(self, guild, operations: Iterable[Tuple[str, Path, Any]]):
+        """Apply a list of ``(operation, path, value)`` to a guild's configuration.
+
+        The operations are applied in order, and either all of them are
+        applied or none are (:class:`ConfigPathError` is raised). The parsed
+        configuration is updated by copying only what lies along each path,
+        instead of parsing the dumped YAML again.
+        """
+        guild_id = int(self._id(guild))
+        config = self.get_compiled(guild_id)
+
+        if config is None and self.persistent.get(guild_id) is not None:
+            raise ConfigPathError('The configuration is invalid, so it can only be replaced.')
+
+        operations: List[Tuple[str, Path, Any]] = [(op, list(path), value) for op, path, value in operations]
 
-        # use the parsed version if applicable
-        if config in self.parsed_cache:
-            return self.parsed_cache[config]
+        # apply to the parsed configuration first, so nothing is changed if an
+        # operation fails
+        data = config.data if config is not None else {}
+        for op, path, value in operations:
+            data = _apply(_copy_path(data, path), op, path, value)
+
+        document = self._document(guild_id, config)
+        for op, path, value in operations:
+            document = _apply(document, op, path, copy.deepcopy(value))
+
+        with io.StringIO() as buf:
+            self.round_trip.dump(document, buf)
+            text = buf.getvalue()
+
+        compiled = GuildConfig.compile(guild_id, next(self._versions), text, data)
+        self._store(guild_id, compiled)
+        self.documents[guild_id] = (compiled.version, document)
+
+        await self.persistent.put(str(guild_id), text)
+
+    async def set(self, guild, path: Path, value):
+        """Set the value at a path of a guild's configuration."""
+        await self.patch(guild, [('add', path, value)])
+
+    async def delete(self, guild, path: Path):
+        """Delete the value at a path of a guild's configuration."""
+        await self.patch(guild, [('remove', path, None)])
+
+    def subscribe(self, section: str, compiler: Callable[[Any, GuildConfig], Any]):
+        """Register the compiler of a configuration section."""
+        if self.compilers.get(section, compiler) != compiler:
+            raise ValueError(f'The {section} section already has a compiler')
+        self.compilers[section] = compiler
+
+    def unsubscribe(self, section: str):
+        self.compilers.pop(section, None)
+        self.artifacts = {key: value for key, value in self.artifacts.items() if key[1] != section}
+
+    def add_cog(self, cog):
+        for _, method in inspect.getmembers(cog, inspect.ismethod):
+            section = getattr(method, '__config_section__', None)
+            if section is not None:
+                self.subscribe(section, method)
+
+    def remove_cog(self, cog):
+        for section, compiler in list(self.compilers.items()):
+            if getattr(compiler, '__self__', None) is cog:
+                self.unsubscribe(section)
+
+    def artifact(self, guild, section: str, default=None):
+        """Return the compiled artifact of a section of a guild's configuration.
+
+        The section's compiler runs at most once per version of the
+        configuration. If the guild has no (valid) configuration, or the
+        compiler fails, ``default`` is returned.
+        """
+        config = self.get_compiled(guild)
+        if config is None:
+            return default
+
+        key = (config.guild_id, section)
+        cached = self.artifacts.get(key)
+        if cached is not None and cached[0] == config.version:
+            return default if cached[1] is None else cached[1]
 
         try:
-            result = self.yaml.load(config)
-            self.parsed_cache[config] = result  # cache
-            return result
-        except YAMLError:
-            log.warning('Invalid YAML config (%s): %s', self._id(guild), config)
-            return None
+            artifact = self.compilers[section](config.data.get(section), config)
+        except Exception:
+            log.exception('failed to compile the %s section of %d', section, config.guild_id)
+            artifact = None
+
+        self.artifacts[key] = (config.version, artifact)
+        return default if artifact is None else artifact
+
+    def get_compiled(self, guild) -> Optional[GuildConfig]:
+        """Return the compiled configuration of a guild."""
+        guild_id = int(self._id(guild))
+
+        try:
+            return self.compiled[guild_id]
+        except KeyError:
+            pass
+
+        text = self.persistent.get(guild_id)
+        compiled = self.compiled[guild_id] = None if text is None else self._compile(guild_id, text)
+        return compiled
+
+    def get(self, guild, *, yaml: bool = False):
+        if yaml:
+            # return the configuration as-is, without parsing
+            return self.persistent.get(self._id(guild))
+
+        compiled = self.get_compiled(guild)
+        return None if compiled is None else compiled.data
 
     def __getitem__(self, guild):
         config = self.get(self._id(guild))
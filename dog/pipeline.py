@@ -0,0 +1,135 @@
+__all__ = ['MessageFacts', 'Stage', 'MessagePipeline', 'message_stage']
+
+import inspect
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import discord
+
+from dog.guild_config import GuildConfig
+
+log = logging.getLogger(__name__)
+
+
+def message_stage(*, order: int = 0, guild_only: bool = False, ignore_bots: bool = False,
+                  ignore_blacklisted: bool = False):
+    """Register a cog method as a stage of the message pipeline.
+
+    The method is called with the message and its :class:`MessageFacts`.
+    Stages run in ascending ``order``, and are skipped for messages that
+    they opt out of.
+    """
+    def decorator(func):
+        func.__message_stage__ = {
+            'order': order,
+            'guild_only': guild_only,
+            'ignore_bots': ignore_bots,
+            'ignore_blacklisted': ignore_blacklisted,
+        }
+        return func
+
+    return decorator
+
+
+class MessageFacts:
+    """Things about a message that are resolved once and shared by every stage."""
+
+    __slots__ = ('message', 'guild', 'compiled', 'config', 'is_bot', 'is_blacklisted', 'disabled_cogs')
+
+    def __init__(self, message: discord.Message, *, bot) -> None:
+        self.message = message
+        self.guild = message.guild
+        self.is_bot = message.author.bot
+        self.is_blacklisted = bot.is_blacklisted(message.author)
+
+        #: the compiled configuration of the guild, if any
+        self.compiled: Optional[GuildConfig] = bot.guild_configs.get_compiled(self.guild) if self.guild else None
+
+        #: the parsed configuration of the guild, or an empty dict
+        self.config: Dict[str, Any] = self.compiled.data if self.compiled is not None else {}
+
+        #: mask of the cogs that are disabled in the guild
+        self.disabled_cogs = bot.disabled_cogs_mask(self.guild) if self.guild else 0
+
+
+class Stage:
+    def __init__(self, cog_name: str, bit: int, handler: Callable, *, order: int, guild_only: bool,
+                 ignore_bots: bool, ignore_blacklisted: bool) -> None:
+        self.cog_name = cog_name
+        self.bit = bit
+        self.handler = handler
+        self.order = order
+        self.guild_only = guild_only
+        self.ignore_bots = ignore_bots
+        self.ignore_blacklisted = ignore_blacklisted
+
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.handler.__qualname__
+
+    @property
+    def average_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def wants(self, facts: MessageFacts) -> bool:
+        return not (
+            (self.bit & facts.disabled_cogs)
+            or (self.guild_only and facts.guild is None)
+            or (self.ignore_bots and facts.is_bot)
+            or (self.ignore_blacklisted and facts.is_blacklisted)
+        )
+
+
+class MessagePipeline:
+    """Runs every cog's message handling in order, in a single task.
+
+    Instead of each cog listening to ``on_message`` (and each separately
+    looking up the guild's configuration and the author's blacklist status),
+    cogs mark methods with :func:`message_stage`. The facts about a message
+    are resolved once, then passed to every stage.
+    """
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.stages: List[Stage] = []
+
+    def add_cog(self, cog):
+        cog_name = type(cog).__name__
+
+        for _, method in inspect.getmembers(cog, inspect.ismethod):
+            options = getattr(method, '__message_stage__', None)
+            if options is None:
+                continue
+            self.stages.append(Stage(cog_name, self.bot.cog_bit(cog_name), method, **options))
+
+        self.stages.sort(key=lambda stage: stage.order)
+
+    def remove_cog(self, cog):
+        self.stages = [stage for stage in self.stages if stage.handler.__self__ is not cog]
+
+    async def run(self, message: discord.Message, facts: MessageFacts = None) -> MessageFacts:
+        if facts is None:
+            facts = MessageFacts(message, bot=self.bot)
+
+        for stage in self.stages:
+            if not stage.wants(facts):
+                continue
+
+            started = time.perf_counter()
+
+            try:
+                await stage.handler(message, facts)
+            except Exception:
+                log.exception('message stage %s failed', stage.name)
+            finally:
+                elapsed = time.perf_counter() - started
+                stage.calls += 1
+                stage.total_time += elapsed
+                stage.max_time = max(stage.max_time, elapsed)
+
+        return facts
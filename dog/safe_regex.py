@@ -0,0 +1,269 @@
+"""Guards for regular expressions that guilds supply in their configuration.
+
+Guild-supplied patterns (custom shortlinks, autoresponse triggers) run on
+every message, and Python's ``re`` can't be interrupted once a match has
+started; it doesn't even release the GIL, so running it in an executor with
+a timeout wouldn't help. Instead, patterns are parsed and rejected when
+their structure allows heavy backtracking:
+
+- backreferences, and repeats inside of repeats or lookarounds
+- repeated alternations, like ``(a|ab)+``
+- two repeats that can match the same characters, unless something
+  required between them can't match any of those characters (``\\w+\\w+``
+  and ``\\w+x\\w+`` are rejected, ``\\d+-\\d+`` is fine)
+- too many repeats in total
+
+What remains can still take time that is polynomial in the length of the
+text, so callers should only match against the first
+:data:`MAX_SUBJECT_LENGTH` characters of a message.
+"""
+
+import re
+from typing import FrozenSet, Iterable, List, NamedTuple, Pattern, Set
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # before Python 3.11
+    import sre_parse
+
+__all__ = ['UnsafePattern', 'MAX_PATTERN_LENGTH', 'MAX_REPEATS', 'MAX_UNBOUNDED_REPEATS', 'MAX_SUBJECT_LENGTH',
+           'sre_parse', 'compile_guarded']
+
+#: the maximum length of a pattern
+MAX_PATTERN_LENGTH = 200
+
+#: the maximum amount of repeats that can match more than once, bounded or not
+MAX_REPEATS = 6
+
+#: the maximum amount of unbounded repeats (like ``+`` and ``*``)
+MAX_UNBOUNDED_REPEATS = 3
+
+#: how much of a message guarded patterns should be matched against
+MAX_SUBJECT_LENGTH = 1000
+
+REPEATS = {'MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'}
+BACKREFERENCES = {'GROUPREF', 'GROUPREF_EXISTS'}
+LOOKAROUNDS = {'ASSERT', 'ASSERT_NOT'}
+
+#: characters that character sets are compared on, along with every
+#: character that a pattern mentions
+ALPHABET = frozenset(map(chr, range(128))) | frozenset(' éßΩж٩ह 中')
+
+CATEGORIES = {
+    'CATEGORY_DIGIT': re.compile(r'\d'),
+    'CATEGORY_NOT_DIGIT': re.compile(r'\D'),
+    'CATEGORY_SPACE': re.compile(r'\s'),
+    'CATEGORY_NOT_SPACE': re.compile(r'\S'),
+    'CATEGORY_WORD': re.compile(r'\w'),
+    'CATEGORY_NOT_WORD': re.compile(r'\W'),
+}
+
+
+class UnsafePattern(ValueError):
+    """Raised when a pattern is invalid, or could backtrack catastrophically."""
+
+
+class _Item(NamedTuple):
+    #: the characters that the item can match
+    chars: FrozenSet[str]
+
+    #: whether the item must match at least one character
+    required: bool
+
+    #: whether the item can match more than one character
+    repeat: bool
+
+
+def _mentioned(pattern) -> Set[str]:
+    """Collect the characters that a parsed pattern mentions literally."""
+    chars = set()
+
+    for op, argument in pattern:
+        name = str(op)
+        if name in ('LITERAL', 'NOT_LITERAL'):
+            chars.add(chr(argument))
+        elif name == 'RANGE':
+            chars.update((chr(argument[0]), chr(argument[1])))
+        elif name == 'IN':
+            chars |= _mentioned(argument)
+        else:
+            for child in _children(argument):
+                chars |= _mentioned(child)
+
+    return chars
+
+
+def _children(argument):
+    """Yield the subpatterns within an argument of a parsed regex node."""
+    if isinstance(argument, sre_parse.SubPattern):
+        yield argument
+    elif isinstance(argument, (list, tuple)):
+        for item in argument:
+            yield from _children(item)
+
+
+class _Checker:
+    def __init__(self, alphabet: FrozenSet[str], ignore_case: bool) -> None:
+        self.alphabet = alphabet
+        self.ignore_case = ignore_case
+        self.repeats = 0
+        self.unbounded = 0
+
+    def _fold(self, chars: Iterable[str]) -> FrozenSet[str]:
+        chars = frozenset(chars)
+        if self.ignore_case:
+            chars |= {char.swapcase() for char in chars} & self.alphabet
+        return chars
+
+    def _set(self, items) -> FrozenSet[str]:
+        """The characters matched by the items of an ``IN`` node."""
+        chars = set()
+        negate = False
+
+        for op, argument in items:
+            name = str(op)
+            if name == 'NEGATE':
+                negate = True
+            elif name == 'LITERAL':
+                chars.add(chr(argument))
+            elif name == 'RANGE':
+                low, high = argument
+                chars |= {char for char in self.alphabet if low <= ord(char) <= high}
+            elif name == 'CATEGORY':
+                category = CATEGORIES.get(str(argument))
+                chars |= self.alphabet if category is None else {
+                    char for char in self.alphabet if category.match(char)
+                }
+            else:
+                # something exotic; assume it matches anything
+                chars |= self.alphabet
+
+        chars = self._fold(chars)
+        return self.alphabet - chars if negate else chars
+
+    def chars(self, pattern) -> FrozenSet[str]:
+        """Every character that a parsed pattern can match anywhere."""
+        chars = frozenset()
+
+        for op, argument in pattern:
+            name = str(op)
+            if name == 'LITERAL':
+                chars |= self._fold(chr(argument))
+            elif name == 'NOT_LITERAL':
+                chars |= self.alphabet - self._fold(chr(argument))
+            elif name == 'ANY':
+                chars |= self.alphabet
+            elif name == 'IN':
+                chars |= self._set(argument)
+            elif name in LOOKAROUNDS:
+                continue
+            else:
+                for child in _children(argument):
+                    chars |= self.chars(child)
+
+        return chars
+
+    def _contains(self, pattern, predicate) -> bool:
+        for op, argument in pattern:
+            if predicate(str(op), argument):
+                return True
+            if any(self._contains(child, predicate) for child in _children(argument)):
+                return True
+        return False
+
+    def _has_repeat(self, pattern) -> bool:
+        return self._contains(pattern, lambda name, argument: name in REPEATS and argument[1] > 1)
+
+    def items(self, pattern) -> List[_Item]:
+        """Flatten a parsed pattern into a sequence of items, checking it along the way."""
+        items = []
+
+        for op, argument in pattern:
+            name = str(op)
+
+            if name in BACKREFERENCES:
+                raise UnsafePattern('Backreferences are not allowed.')
+
+            if name in REPEATS:
+                minimum, maximum, body = argument
+
+                if maximum <= 1:
+                    # an optional part, like (...)?
+                    items.extend(item._replace(required=False) for item in self.items(body))
+                    continue
+
+                if self._has_repeat(body):
+                    raise UnsafePattern('Nested repeats are not allowed.')
+                if self._contains(body, lambda name, _argument: name == 'BRANCH'):
+                    raise UnsafePattern('Repeated alternations are not allowed.')
+
+                self.items(body)  # for the checks
+                self.repeats += 1
+                if maximum == sre_parse.MAXREPEAT:
+                    self.unbounded += 1
+
+                items.append(_Item(self.chars(body), minimum > 0, True))
+            elif name == 'BRANCH':
+                branches = [self.items(branch) for branch in argument[1]]
+                items.append(_Item(
+                    frozenset().union(*(item.chars for branch in branches for item in branch)),
+                    all(any(item.required for item in branch) for branch in branches),
+                    any(item.repeat for branch in branches for item in branch),
+                ))
+            elif name in LOOKAROUNDS:
+                if self._has_repeat(argument[1]):
+                    raise UnsafePattern('Repeats inside of lookarounds are not allowed.')
+                self.items(argument[1])
+            elif name == 'AT':
+                continue
+            elif name in ('LITERAL', 'NOT_LITERAL', 'ANY', 'IN'):
+                items.append(_Item(self.chars([(op, argument)]), True, False))
+            else:
+                # groups (and anything else that contains subpatterns)
+                for child in _children(argument):
+                    items.extend(self.items(child))
+
+        self._check_sequence(items)
+        return items
+
+    @staticmethod
+    def _check_sequence(items: List[_Item]):
+        repeats = [index for index, item in enumerate(items) if item.repeat]
+
+        for position, first in enumerate(repeats):
+            for second in repeats[position + 1:]:
+                shared = items[first].chars & items[second].chars
+                if not shared:
+                    continue
+
+                # something in between has to split them up
+                if any(item.required and not item.chars & shared for item in items[first + 1:second]):
+                    continue
+
+                raise UnsafePattern('Repeats that can match the same characters must be separated by something '
+                                    'that they can not match.')
+
+
+def compile_guarded(pattern: str, *, max_length: int = MAX_PATTERN_LENGTH) -> Pattern:
+    """Compile a guild-supplied pattern, raising :class:`UnsafePattern` if it's invalid or unsafe."""
+    if not isinstance(pattern, str) or not pattern:
+        raise UnsafePattern('The pattern must be text.')
+
+    if len(pattern) > max_length:
+        raise UnsafePattern(f'The pattern is longer than {max_length} characters.')
+
+    try:
+        parsed = sre_parse.parse(pattern)
+        compiled = re.compile(pattern)
+    except (re.error, RecursionError, OverflowError) as error:
+        raise UnsafePattern(f'The pattern is invalid: {error}')
+
+    checker = _Checker(ALPHABET | _mentioned(parsed), bool(compiled.flags & re.IGNORECASE))
+    checker.items(parsed)
+
+    if checker.unbounded > MAX_UNBOUNDED_REPEATS:
+        raise UnsafePattern(f'The pattern has more than {MAX_UNBOUNDED_REPEATS} unbounded repeats.')
+    if checker.repeats > MAX_REPEATS:
+        raise UnsafePattern(f'The pattern has more than {MAX_REPEATS} repeats.')
+
+    return compiled
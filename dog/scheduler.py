@@ -0,0 +1,174 @@
+__all__ = ['Lane', 'EventScheduler', 'POLICIES']
+
+import asyncio
+import collections
+from typing import Any, Callable, Deque, Dict, Tuple
+
+#: what to do when a lane's queue is full:
+#:
+#: - ``drop``: drop the incoming event
+#: - ``shed``: drop the oldest queued ``drop`` or ``shed`` event to make room
+#: - ``keep``: wait for room (for events that shouldn't be lost), up to a
+#:   limit; past it, the incoming event is dropped
+POLICIES = {'drop', 'shed', 'keep'}
+
+DEFAULT_POLICIES = {
+    'message': 'shed',
+    'message_edit': 'shed',
+    'member_update': 'shed',
+    'typing': 'drop',
+
+    # these arrive in bursts during raids. joins are kept, because Gatekeeper
+    # has to see every one of them; leaves are only logged
+    'member_join': 'keep',
+    'member_remove': 'shed',
+}
+
+Job = Tuple[float, Callable, str, tuple, Dict[str, Any]]
+
+
+class Lane:
+    """Bounded queues of event handler invocations, drained by a pool of workers.
+
+    Events that can be lost (``drop`` and ``shed``) and events that can't
+    (``keep``) are queued separately, so shedding never evicts an event that
+    must be kept. Both queues hold up to ``queue_size`` jobs. When the kept
+    queue is full, up to ``max_waiting`` more kept jobs wait for room in
+    order, and anything past that is dropped. Workers take kept jobs first.
+    """
+
+    def __init__(self, name: str, *, run: Callable, concurrency: int, queue_size: int, max_waiting: int,
+                 loop) -> None:
+        self.name = name
+        self.run = run
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_waiting = max_waiting
+        self.loop = loop
+        self.sheddable: Deque[Job] = collections.deque()
+        self.kept: Deque[Job] = collections.deque()
+        self.ready = asyncio.Semaphore(0)
+        self.workers = []
+
+        #: kept jobs that are waiting for room in the kept queue
+        self.overflow: Deque[Job] = collections.deque()
+
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self.sheddable) + len(self.kept)
+
+    @property
+    def waiting(self) -> int:
+        return len(self.overflow)
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.processed if self.processed else 0.0
+
+    def submit(self, job: Job, policy: str) -> bool:
+        """Queue a job, returning whether it was accepted."""
+        if not self.workers:
+            self.workers = [self.loop.create_task(self._work()) for _ in range(self.concurrency)]
+
+        if policy == 'keep':
+            if len(self.kept) < self.queue_size:
+                self.kept.append(job)
+            elif len(self.overflow) < self.max_waiting:
+                # moved into the kept queue as it drains
+                self.overflow.append(job)
+            else:
+                self.dropped += 1
+                return False
+        elif len(self.sheddable) >= self.queue_size:
+            self.dropped += 1
+            if policy == 'drop':
+                return False
+            # replaces the oldest job, so nothing new is ready
+            self.sheddable.popleft()
+            self.sheddable.append(job)
+            return True
+        else:
+            self.sheddable.append(job)
+
+        self.ready.release()
+        self.max_depth = max(self.max_depth, self.depth)
+        return True
+
+    async def _work(self):
+        while True:
+            await self.ready.acquire()
+
+            if self.kept:
+                job = self.kept.popleft()
+                if self.overflow:
+                    self.kept.append(self.overflow.popleft())
+            else:
+                job = self.sheddable.popleft()
+
+            queued_at, listener, event_name, args, kwargs = job
+
+            wait = self.loop.time() - queued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.processed += 1
+
+            # _run_event handles (and reports) exceptions by itself
+            await self.run(listener, event_name, *args, **kwargs)
+
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+        self.sheddable.clear()
+        self.kept.clear()
+        self.overflow.clear()
+
+
+class EventScheduler:
+    """Runs event handlers through per-cog lanes instead of unbounded tasks.
+
+    Every cog gets its own lane, so a flood of one kind of event can only
+    back up the cogs that listen to it, and at most ``concurrency`` handlers
+    of a cog run at once. What happens when a lane is full is decided per
+    event by a policy (see :data:`POLICIES`).
+    """
+
+    def __init__(self, bot, *, concurrency: int = 4, queue_size: int = 1000, max_waiting: int = 1000,
+                 policies: Dict[str, str] = None, default_policy: str = 'keep') -> None:
+        self.bot = bot
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_waiting = max_waiting
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.default_policy = default_policy
+        self.lanes: Dict[str, Lane] = {}
+
+        for event_name, policy in self.policies.items():
+            if policy not in POLICIES:
+                raise ValueError(f'Unknown scheduler policy for {event_name}: {policy}')
+
+    def lane(self, name: str) -> Lane:
+        lane = self.lanes.get(name)
+        if lane is None:
+            lane = self.lanes[name] = Lane(
+                name, run=self.bot._run_event, concurrency=self.concurrency, queue_size=self.queue_size,
+                max_waiting=self.max_waiting, loop=self.bot.loop,
+            )
+        return lane
+
+    def submit(self, lane_name: str, listener: Callable, event_name: str, *args, **kwargs) -> bool:
+        """Schedule a listener to run in a lane."""
+        policy = self.policies.get(event_name, self.default_policy)
+        job = (self.bot.loop.time(), listener, event_name, args, kwargs)
+        return self.lane(lane_name).submit(job, policy)
+
+    def close(self):
+        for lane in self.lanes.values():
+            lane.close()
@@ -0,0 +1,269 @@
+__all__ = ['AsyncLogStorage']
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class AsyncLogStorage:
+    """A key-value store backed by an append-only record log.
+
+    This is a drop-in replacement for lifesaver's ``AsyncJSONStorage``.
+    Instead of rewriting the entire file on every ``put`` or ``delete``, each
+    change is appended to ``<file>.log`` as a single JSON record, so the cost
+    of a write is proportional to the changed key rather than the size of the
+    store.
+
+    Writes that arrive while a flush is in progress are grouped into the next
+    flush (group commit), and the log is compacted in the background once
+    enough of it is made up of overwritten records. If an append fails, the
+    next flush (or closing the store) rewrites the whole log instead, so the
+    records that failed aren't lost.
+
+    If the log does not exist yet but ``file`` does, the legacy JSON document
+    is imported on load.
+    """
+
+    def __init__(self, file: str, *, loop=None, compact_threshold: int = 1000,
+                 compact_ratio: float = 1.0) -> None:
+        self.file = file
+        self.log_file = f'{file}.log'
+        self.loop = loop or asyncio.get_event_loop()
+
+        #: the minimum amount of dead records before compaction is considered
+        self.compact_threshold = compact_threshold
+
+        #: the ratio of dead records to live keys that triggers compaction
+        self.compact_ratio = compact_ratio
+
+        self._data: Dict[str, Any] = {}
+        self._dead = 0
+        self._pending: List[str] = []
+        self._batch = None
+        self._lock = asyncio.Lock()
+        self._compacting = False
+
+        #: whether an append failed, so the log is missing records
+        self._needs_snapshot = False
+
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.log_file):
+            self._import_legacy()
+            return
+
+        records = 0
+
+        with open(self.log_file, encoding='utf-8') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # most likely a torn write at the end of the log
+                    log.warning('%s: skipping corrupt record', self.log_file)
+                    continue
+
+                records += 1
+                key = record['k']
+
+                if record.get('d'):
+                    self._data.pop(key, None)
+                else:
+                    self._data[key] = record['v']
+
+        self._dead = records - len(self._data)
+
+    def _import_legacy(self):
+        try:
+            with open(self.file, encoding='utf-8') as fp:
+                self._data = json.load(fp)
+        except FileNotFoundError:
+            return
+
+        log.info('importing %d key(s) from legacy storage %s', len(self._data), self.file)
+        self._write_snapshot(self._encode_all(self._data.items()))
+
+    @staticmethod
+    def _encode(key: str, value: Any = None, *, delete: bool = False) -> str:
+        if delete:
+            return json.dumps({'k': key, 'd': True}) + '\n'
+        return json.dumps({'k': key, 'v': value}) + '\n'
+
+    def _encode_all(self, items: Iterable[Tuple[str, Any]]) -> List[str]:
+        return [self._encode(key, value) for key, value in items]
+
+    def _append(self, records: List[str]):
+        with open(self.log_file, 'a', encoding='utf-8') as fp:
+            fp.writelines(records)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _write_snapshot(self, records: List[str]):
+        temporary = self.log_file + '.tmp'
+
+        with open(temporary, 'w', encoding='utf-8') as fp:
+            fp.writelines(records)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        os.replace(temporary, self.log_file)
+
+    async def _commit(self, records: List[str]):
+        self._pending.extend(records)
+
+        if self._batch is None:
+            # start a new batch; everything that is queued until the flush
+            # actually begins will be written along with it
+            self._batch = self.loop.create_future()
+            self.loop.create_task(self._flush())
+
+        await asyncio.shield(self._batch)
+
+    async def _flush(self):
+        async with self._lock:
+            records, self._pending = self._pending, []
+            batch, self._batch = self._batch, None
+
+            # a compaction already wrote this batch as part of its snapshot
+            if batch is None:
+                return
+
+            try:
+                if self._needs_snapshot:
+                    # the snapshot includes these records
+                    await self._snapshot()
+                else:
+                    await self.loop.run_in_executor(None, self._append, records)
+            except Exception as error:
+                log.exception('%s: failed to write %d record(s), the next write will rewrite the log',
+                              self.log_file, len(records))
+                self._needs_snapshot = True
+                batch.set_exception(error)
+                return
+
+            batch.set_result(None)
+
+        if self._should_compact():
+            self.loop.create_task(self.compact())
+
+    def _should_compact(self) -> bool:
+        return (not self._compacting
+                and self._dead >= self.compact_threshold
+                and self._dead >= len(self._data) * self.compact_ratio)
+
+    async def compact(self):
+        """Rewrite the log so that it only contains live keys."""
+        if self._compacting:
+            return
+
+        self._compacting = True
+
+        try:
+            async with self._lock:
+                # keys are unique in the snapshot, so queued records (whose
+                # values are already in it) are written as part of it instead
+                # of being appended again afterwards
+                pending, self._pending = self._pending, []
+                batch, self._batch = self._batch, None
+
+                try:
+                    dead = await self._snapshot()
+                except Exception:
+                    self._requeue(pending, batch)
+                    raise
+
+                if batch is not None:
+                    batch.set_result(None)
+
+                log.debug('%s: compacted away %d dead record(s)', self.log_file, dead)
+        finally:
+            self._compacting = False
+
+    async def _snapshot(self) -> int:
+        """Rewrite the log with only live keys, returning how many dead records were dropped.
+
+        The lock must be held.
+        """
+        # values are encoded here (and not in the executor) because callers
+        # are free to mutate them after we return
+        records = self._encode_all(list(self._data.items()))
+        dead = self._dead
+
+        await self.loop.run_in_executor(None, self._write_snapshot, records)
+
+        # records that were overwritten while writing are still dead
+        self._dead -= dead
+        self._needs_snapshot = False
+        return dead
+
+    def _requeue(self, records: List[str], batch):
+        """Put records taken from a batch back in front of the queue."""
+        self._pending[:0] = records
+
+        if batch is None:
+            return
+
+        if self._batch is None:
+            # the flush that was scheduled for this batch hasn't run yet
+            self._batch = batch
+            return
+
+        def chain(future):
+            if future.exception() is not None:
+                batch.set_exception(future.exception())
+            else:
+                batch.set_result(None)
+
+        self._batch.add_done_callback(chain)
+
+    async def put(self, key, value):
+        key = str(key)
+        if key in self._data:
+            self._dead += 1
+        self._data[key] = value
+        await self._commit([self._encode(key, value)])
+
+    async def put_many(self, items: Iterable[Tuple[Any, Any]]):
+        """Store multiple keys with a single append."""
+        records = []
+
+        for key, value in items:
+            key = str(key)
+            if key in self._data:
+                self._dead += 1
+            self._data[key] = value
+            records.append(self._encode(key, value))
+
+        if records:
+            await self._commit(records)
+
+    async def delete(self, key):
+        key = str(key)
+        if key not in self._data:
+            return
+        del self._data[key]
+        self._dead += 2  # both the old value and the tombstone are dead
+        await self._commit([self._encode(key, delete=True)])
+
+    def get(self, key, default=None):
+        return self._data.get(str(key), default)
+
+    def all(self) -> Dict[str, Any]:
+        return self._data
+
+    def __contains__(self, key) -> bool:
+        return str(key) in self._data
+
+    async def close(self):
+        """Wait for all pending writes to hit the disk."""
+        try:
+            if self._batch is not None:
+                await asyncio.shield(self._batch)
+        finally:
+            if self._needs_snapshot:
+                await self.compact()
@@ -1,12 +1,39 @@
 from quart import Blueprint, g, jsonify as json, request
 from ruamel.yaml import YAML, YAMLError
 
+from dog.guild_config import ConfigPathError
 from .decorators import require_auth
 
 api = Blueprint('api', __name__)
 yaml = YAML(typ='safe')
 
 
+def parse_pointer(pointer: str):
+    """Parse a JSON Pointer (RFC 6901) into a list of tokens."""
+    if not pointer:
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f'Invalid JSON pointer: {pointer!r}')
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def parse_patch(patch):
+    """Parse a JSON Patch (RFC 6902) document into a list of operations."""
+    if not isinstance(patch, list):
+        raise ValueError('A JSON patch must be a list of operations.')
+
+    operations = []
+
+    for operation in patch:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise ValueError('Every operation must have an "op" and a "path".')
+        if operation['op'] in ('add', 'replace', 'test') and 'value' not in operation:
+            raise ValueError(f'{operation["op"]} operations must have a "value".')
+        operations.append((operation['op'], parse_pointer(operation['path']), operation.get('value')))
+
+    return operations
+
+
 def inflate_guild(g):
     return {
         "id": str(g.id), "name": g.name, "members": g.member_count,
@@ -41,6 +68,19 @@ async def api_guild_config(guild_id):
             'code': 'CONFIG_FORBIDDEN',
         }), 401
 
+    if request.method == 'PATCH' and request.mimetype == 'application/json-patch+json':
+        try:
+            operations = parse_patch(await request.get_json(force=True))
+            await g.bot.guild_configs.patch(guild_id, operations)
+        except (ValueError, ConfigPathError) as err:
+            return json({
+                "error": True,
+                "message": f"Invalid patch ({err}).",
+                "code": "INVALID_PATCH",
+            }), 400
+
+        return json({"success": True})
+
     if request.method == 'PATCH':
         text = await request.get_data(raw=False)
 
@@ -70,8 +110,16 @@ async def api_guild_config(guild_id):
 @api.route('/guilds')
 @require_auth
 def api_guilds():
-    guilds = [
-        inflate_guild(guild) for guild in g.bot.guilds
-        if g.bot.guild_configs.can_edit(g.user, guild)
-    ]
+    index = g.bot.editor_index
+
+    if index.ready:
+        editable = (g.bot.get_guild(guild_id) for guild_id in index.editable_guilds(g.user))
+        guilds = [inflate_guild(guild) for guild in editable if guild is not None]
+    else:
+        # the index is still being built
+        guilds = [
+            inflate_guild(guild) for guild in g.bot.guilds
+            if g.bot.guild_configs.can_edit(g.user, guild)
+        ]
+
     return json(guilds)
@@ -0,0 +1,45 @@
+from dog.ext.gatekeeper.cog import DEFAULT_DISTANCE, block_avatar_operations
+from dog.ext.gatekeeper.compiled import compile_checks
+from dog.guild_config import _apply
+
+HASH = '00ff00ff00ff00ff'
+
+
+def apply(config, operations):
+    for op, path, value in operations:
+        config = _apply(config, op, path, value)
+    return config
+
+
+def compiled_check(config):
+    checks = compile_checks(config['gatekeeper']['checks'])
+    assert [check.name for check in checks] == ['block_similar_avatars']
+    assert checks[0].error is None
+    return checks[0]
+
+
+def test_enables_a_disabled_check():
+    config = {'gatekeeper': {'checks': {'block_similar_avatars': {
+        'enabled': False, 'hashes': [], 'distance': 4,
+    }}}}
+
+    config = apply(config, block_avatar_operations(config['gatekeeper']['checks']['block_similar_avatars'], HASH))
+
+    options = config['gatekeeper']['checks']['block_similar_avatars']
+    assert options == {'enabled': True, 'hashes': [HASH], 'distance': 4}
+    compiled_check(config)
+
+
+def test_fills_in_a_missing_distance():
+    config = {'gatekeeper': {'checks': {'block_similar_avatars': {'hashes': ['ffffffffffffffff']}}}}
+
+    config = apply(config, block_avatar_operations(config['gatekeeper']['checks']['block_similar_avatars'], HASH))
+
+    options = config['gatekeeper']['checks']['block_similar_avatars']
+    assert options == {'hashes': ['ffffffffffffffff', HASH], 'distance': DEFAULT_DISTANCE}
+    compiled_check(config)
+
+
+def test_already_blocked():
+    options = {'hashes': [HASH], 'distance': 4}
+    assert block_avatar_operations(options, HASH) == []